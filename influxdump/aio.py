@@ -0,0 +1,471 @@
+# -*- coding: utf-8 -*-
+"""Asyncio backend of the influxdb client.
+
+Requests are sent from an event loop running in a background thread, over a
+pool of keep-alive HTTP/1.1 connections built on asyncio streams. Chunked
+query responses are streamed, one result set per line of the response.
+
+`AioInfluxDBClient` keeps the interface of `influxdump.db.InfluxDBClient` and
+can be used from any number of threads: all of them share the same event loop
+and connection pool, so that a single process keeps many requests in flight
+without one http session per worker.
+"""
+import asyncio
+import base64
+import gzip
+import json
+import threading
+from urllib.parse import urlencode
+import zlib
+
+from influxdb.client import _msgpack_parse_hook
+from influxdb.exceptions import InfluxDBClientError, InfluxDBServerError
+from influxdb.line_protocol import make_lines
+from influxdb.resultset import ResultSet
+import msgpack
+from requests.exceptions import (
+    ConnectionError,
+    ConnectTimeout,
+    ReadTimeout,
+    RequestException,
+)
+
+from .db import POOLSIZE, InfluxDBClient, SchemaCache
+
+
+# size of the reads of response bodies
+READSIZE = 1 << 16
+
+NETWORK_ERRORS = (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError)
+
+
+def network_error(e):
+    """Return the `requests` exception matching a network error, so that
+    callers handle errors of both backends the same way.
+    """
+    if isinstance(e, RequestException):
+        return e
+    if isinstance(e, asyncio.TimeoutError):
+        return ReadTimeout(e)
+    return ConnectionError(e)
+
+
+class Response(object):
+    """Response of a http request, the body is read incrementally with
+    `read` or `readline`.
+    """
+    def __init__(self, reader, status, headers, timeout=None):
+        self._reader = reader
+        self._timeout = timeout
+        self.status = status
+        self.headers = headers
+        self._buffer = b''
+        self._eof = False
+        self._decoder = None
+        if headers.get('content-encoding') == 'gzip':
+            self._decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self.chunked = 'chunked' in headers.get('transfer-encoding', '')
+        if status == 204 or status == 304 or status < 200:
+            # no body
+            self.chunked = False
+            self._remaining = 0
+        elif self.chunked:
+            self._remaining = None
+        elif 'content-length' in headers:
+            self._remaining = int(headers['content-length'])
+        else:
+            # body delimited by the end of the connection
+            self._remaining = -1
+        self.reusable = self._remaining != -1 \
+                and headers.get('connection', '').lower() != 'close'
+
+    async def _fill(self):
+        size = len(self._buffer)
+        await asyncio.wait_for(self._read(), self._timeout)
+        if self._decoder is not None:
+            data = self._decoder.decompress(self._buffer[size:])
+            if self._eof:
+                data += self._decoder.flush()
+            self._buffer = self._buffer[:size] + data
+
+    async def _read(self):
+        if self.chunked:
+            size = int((await self._reader.readline()).split(b';')[0], 16)
+            if size == 0:
+                # trailers
+                while (await self._reader.readline()) not in (b'\r\n', b''):
+                    pass
+                self._eof = True
+                return
+            self._buffer += await self._reader.readexactly(size)
+            await self._reader.readexactly(2)
+        elif self._remaining == -1:
+            data = await self._reader.read(READSIZE)
+            if not data:
+                self._eof = True
+            self._buffer += data
+        else:
+            if self._remaining == 0:
+                self._eof = True
+                return
+            data = await self._reader.read(min(self._remaining, READSIZE))
+            if not data:
+                raise asyncio.IncompleteReadError(self._buffer, None)
+            self._remaining -= len(data)
+            self._buffer += data
+
+    async def readline(self):
+        """Return the next line of the body, b'' at the end of the body"""
+        while b'\n' not in self._buffer and not self._eof:
+            await self._fill()
+        (line, sep, self._buffer) = self._buffer.partition(b'\n')
+        return line + sep
+
+    async def read(self):
+        """Return the rest of the body"""
+        while not self._eof:
+            await self._fill()
+        (data, self._buffer) = (self._buffer, b'')
+        return data
+
+
+class Connection(object):
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.reused = False
+
+    def is_closed(self):
+        return self.writer.is_closing() or self.reader.at_eof()
+
+    def close(self):
+        self.writer.close()
+
+    async def request(self, method, target, headers, body=b'', timeout=None):
+        lines = ["{} {} HTTP/1.1".format(method, target)]
+        for (name, value) in headers.items():
+            lines.append("{}: {}".format(name, value))
+        lines.append("Content-Length: {}".format(len(body)))
+        self.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1'))
+        if body:
+            self.writer.write(body)
+        await self.writer.drain()
+
+        status_line = await asyncio.wait_for(self.reader.readline(), timeout)
+        if not status_line:
+            raise asyncio.IncompleteReadError(b'', None)
+        status = int(status_line.split()[1])
+        response_headers = {}
+        while True:
+            line = await asyncio.wait_for(self.reader.readline(), timeout)
+            if line in (b'\r\n', b'\n', b''):
+                break
+            (name, _, value) = line.decode('latin-1').partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+        return Response(self.reader, status, response_headers, timeout)
+
+
+class ConnectionPool(object):
+    """Pool of at most `size` keep-alive connections, must be used from the
+    event loop thread.
+    """
+    def __init__(self, host, port, size=POOLSIZE, timeout=None):
+        self.host = host
+        self.port = port
+        self.size = size
+        self.timeout = timeout
+        self.opened = 0
+        self._idle = []
+        self._semaphore = None
+
+    async def acquire(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.size)
+        await self._semaphore.acquire()
+        while self._idle:
+            connection = self._idle.pop()
+            if not connection.is_closed():
+                connection.reused = True
+                return connection
+            connection.close()
+        try:
+            return await self.connect()
+        except BaseException:
+            self._semaphore.release()
+            raise
+
+    async def connect(self):
+        try:
+            (reader, writer) = await asyncio.wait_for(
+                    asyncio.open_connection(self.host, self.port),
+                    self.timeout)
+        except asyncio.TimeoutError as e:
+            raise ConnectTimeout(e)
+        self.opened += 1
+        return Connection(reader, writer)
+
+    def release(self, connection, reuse=True):
+        if reuse is True and not connection.is_closed():
+            self._idle.append(connection)
+        else:
+            connection.close()
+        self._semaphore.release()
+
+    def close(self):
+        for connection in self._idle:
+            connection.close()
+        self._idle = []
+
+
+class AsyncClient(object):
+    """Coroutine based influxdb client, see `AioInfluxDBClient` for its use
+    from threads.
+    """
+    def __init__(self, host, port, user, pwd, db, pool_size=POOLSIZE,
+            gzip=False, msgpack=False, timeout=None):
+        (connect_timeout, self.timeout) = timeout or (None, None)
+        self.db = db
+        self.gzip = gzip
+        self.msgpack = msgpack
+        self.pool = ConnectionPool(host, port, pool_size, connect_timeout)
+        self.headers = {
+            "Host": "{}:{}".format(host, port),
+            "Accept": "application/json",
+        }
+        if gzip is True:
+            self.headers["Accept-Encoding"] = "gzip"
+        if user != '':
+            credentials = "{}:{}".format(user, pwd).encode('utf-8')
+            self.headers["Authorization"] = "Basic {}".format(
+                    base64.b64encode(credentials).decode('ascii'))
+
+    async def _send(self, method, path, params, body=b'', headers=None):
+        """Send a request, return `(connection, response)`. A request failing
+        on a reused connection (closed by the server while idle) is sent
+        again on a new connection.
+        """
+        target = "/{}?{}".format(path, urlencode(params))
+        _headers = dict(self.headers)
+        if headers is not None:
+            _headers.update(headers)
+
+        try:
+            connection = await self.pool.acquire()
+        except NETWORK_ERRORS as e:
+            raise network_error(e)
+        try:
+            try:
+                response = await connection.request(method, target, _headers,
+                        body, self.timeout)
+            except (OSError, asyncio.IncompleteReadError) as e:
+                if connection.reused is False \
+                        or isinstance(e, asyncio.TimeoutError):
+                    raise
+                connection.close()
+                connection = await self.pool.connect()
+                response = await connection.request(method, target, _headers,
+                        body, self.timeout)
+        except NETWORK_ERRORS as e:
+            self.pool.release(connection, False)
+            raise network_error(e)
+        except BaseException:
+            self.pool.release(connection, False)
+            raise
+        return (connection, response)
+
+    async def _check(self, connection, response, expected):
+        if response.status == expected:
+            return
+        try:
+            content = await response.read()
+        finally:
+            self.pool.release(connection, response.reusable)
+        if 500 <= response.status < 600:
+            raise InfluxDBServerError(content)
+        raise InfluxDBClientError(content.decode('utf-8', 'replace'),
+                response.status)
+
+    def _get_params(self, query, chunked=False, chunk_size=0):
+        params = {"q": query, "db": self.db}
+        if chunked is True:
+            params["chunked"] = "true"
+            if chunk_size > 0:
+                params["chunk_size"] = chunk_size
+        return params
+
+    async def query(self, query):
+        """Run a query, return a `ResultSet`, or a list of them for
+        multi-statement queries.
+        """
+        headers = None
+        if self.msgpack is True:
+            # servers not supporting msgpack answer with json
+            headers = {"Accept": "application/x-msgpack"}
+        (connection, response) = await self._send("GET", "query",
+                self._get_params(query), headers=headers)
+        await self._check(connection, response, 200)
+        try:
+            content = await response.read()
+        except NETWORK_ERRORS as e:
+            self.pool.release(connection, False)
+            raise network_error(e)
+        self.pool.release(connection, response.reusable)
+
+        if response.headers.get('content-type') == 'application/x-msgpack':
+            data = msgpack.unpackb(content, ext_hook=_msgpack_parse_hook,
+                    raw=False)
+        else:
+            data = json.loads(content.decode('utf-8'))
+        results = [ResultSet(result) for result in data.get('results', [])]
+        if len(results) == 1:
+            return results[0]
+        return results
+
+    async def query_chunks(self, query, chunk_size=0):
+        """Async generator of the result sets of a chunked query, read from
+        the response as they are received.
+        """
+        (connection, response) = await self._send("GET", "query",
+                self._get_params(query, True, chunk_size))
+        await self._check(connection, response, 200)
+        complete = False
+        try:
+            while True:
+                line = await response.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                data = json.loads(line.decode('utf-8'))
+                result_set = {}
+                for result in data.get('results', []):
+                    for key in result:
+                        if isinstance(result[key], list):
+                            result_set.setdefault(key, []).extend(result[key])
+                yield ResultSet(result_set)
+            complete = True
+        except NETWORK_ERRORS as e:
+            raise network_error(e)
+        finally:
+            # an abandoned response leaves unread data on the connection
+            self.pool.release(connection, complete and response.reusable)
+
+    async def write(self, data, precision=None):
+        """Write line protocol data (bytes)"""
+        params = {"db": self.db}
+        if precision is not None:
+            params["precision"] = precision
+        headers = {"Content-Type": "application/octet-stream"}
+        if self.gzip is True:
+            data = gzip.compress(data)
+            headers["Content-Encoding"] = "gzip"
+        (connection, response) = await self._send("POST", "write", params,
+                data, headers)
+        await self._check(connection, response, 204)
+        try:
+            await response.read()
+        except NETWORK_ERRORS as e:
+            self.pool.release(connection, False)
+            raise network_error(e)
+        self.pool.release(connection, response.reusable)
+
+    async def write_points(self, points, time_precision=None, protocol='json'):
+        if protocol == 'json':
+            data = make_lines({"points": points}, time_precision)
+        else:
+            data = '\n'.join(points) + '\n'
+        await self.write(data.encode('utf-8'), time_precision)
+        return True
+
+
+class EventLoopThread(object):
+    """Event loop running in a daemon thread"""
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def run(self, coro):
+        """Run a coroutine in the loop and wait for its result"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+
+
+async def _next(agen):
+    try:
+        return (True, await agen.__anext__())
+    except StopAsyncIteration:
+        return (False, None)
+
+
+class AioInfluxDBClient(InfluxDBClient):
+    """Thread safe influxdb client sending its requests with `AsyncClient`
+    from a background event loop.
+    """
+    def __init__(self,
+            host,
+            port,
+            user,
+            pwd,
+            db,
+            schema=None,
+            gzip=False,
+            msgpack=False,
+            pool_size=POOLSIZE,
+            timeout=None,
+    ):
+        self.schema = schema or SchemaCache()
+        self._params = {
+                "host": host,
+                "port": port,
+                "user": user,
+                "pwd": pwd,
+                "db": db,
+                "gzip": gzip,
+                "msgpack": msgpack,
+                "pool_size": pool_size,
+                "timeout": timeout,
+        }
+        self._loop = EventLoopThread()
+        self._client = AsyncClient(host, port, user, pwd, db, pool_size, gzip,
+                msgpack, timeout)
+
+    def clone(self):
+        """The client is thread safe, clones share its event loop and its
+        connection pool.
+        """
+        return self
+
+    def close(self):
+        self._loop.run(self._close())
+        self._loop.stop()
+
+    async def _close(self):
+        self._client.pool.close()
+
+    def query(self, query, chunked=False, chunk_size=0, **kwargs):
+        if chunked is True:
+            return self._iter(self._client.query_chunks(query, chunk_size))
+        return self._loop.run(self._client.query(query))
+
+    def _iter(self, agen):
+        try:
+            while True:
+                (more, value) = self._loop.run(_next(agen))
+                if more is False:
+                    return
+                yield value
+        finally:
+            self._loop.run(agen.aclose())
+
+    def show_measurements(self):
+        return self.query("SHOW MEASUREMENTS")
+
+    def write_points(self, points, time_precision=None, protocol='json',
+            **kwargs):
+        return self._loop.run(self._client.write_points(points,
+            time_precision, protocol))
@@ -3,14 +3,18 @@
 """
 import argparse
 import getpass
-import json
 import os
-import re
 import sys
 
-from influxdump.data import get_meta
-from influxdump.db import Query, get_client
-from influxdump.exceptions import TypecastError
+from influxdump.data import (
+    get_meta,
+    group_chunks,
+    list_chunks,
+    read_meta,
+    run_processes,
+)
+from influxdump.db import SCHEMA_TTL, Query, get_client, get_schema
+from influxdump.exceptions import CompressionError, TypecastError
 
 
 def get_args():
@@ -19,6 +23,11 @@ def get_args():
             type=str)
     parser.add_argument('-H', '--host', help='server host',
             default="localhost", type=str)
+    parser.add_argument('-j', '--jobs', default=1, type=int,
+            help="""
+            number of processes checking measurements concurrently, defaults
+            to 1
+            """)
     parser.add_argument('-L', '--legacy', action="store_true",
             help='influxdb legacy client (<=0.8)')
     parser.add_argument('-m', '--measurements', help='measurement pattern')
@@ -28,6 +37,16 @@ def get_args():
             help="""
             Retry a dump query in case of problem, 0 to disable, defaults to 0
             """)
+    parser.add_argument('--schema-cache', default=None,
+            help="""
+            schema snapshot file (measurements, field types and tag keys),
+            reused by later runs until it expires, created if missing
+            """)
+    parser.add_argument('--schema-ttl', default=SCHEMA_TTL, type=int,
+            help="""
+            number of seconds after which the schema snapshot is discovered
+            again, defaults to {}
+            """.format(SCHEMA_TTL))
     parser.add_argument('-u', '--user', help='username', default='', type=str)
     parser.add_argument('-v', '--verbose', help='make the script verbose',
             action="store_true")
@@ -47,10 +66,13 @@ def get_args():
     return {
         "db": args.database,
         "host": args.host,
+        "jobs": args.jobs,
         "legacy": args.legacy,
         "measurements": args.measurements,
         "port": args.port,
         "retry": args.retry,
+        "schema_cache": args.schema_cache,
+        "schema_ttl": args.schema_ttl,
         "user": args.user,
         "verbose": args.verbose,
         "pwd": pwd,
@@ -58,10 +80,77 @@ def get_args():
     }
 
 
+def check_chunks(group, verbose=False):
+    """Check the types of the chunk files of a measurement, `group` being
+    the `(datafile, chunk)` items of the measurement and its field types in
+    the database.
+
+    :returns: the lines of the report
+    """
+    (items, types) = group
+    lines = []
+    for (datafile, chunk) in items:
+        if verbose is True:
+            lines.append(
+                "> test casting for {}\n".format(os.path.basename(datafile)))
+
+        # catalogued dumps are checked without opening chunk files
+        if chunk is not None:
+            dump_meta = chunk["meta"]
+        else:
+            dump_meta = read_meta(datafile)
+
+        # Measurement does not exist in db
+        if types == {}:
+            lines.append(
+                "# {}\n".format(dump_meta["measurement"])
+            )
+            continue
+
+        # Measurement does not exist in db
+        if types == dump_meta["types"]:
+            lines.append(
+                "= {}\n".format(dump_meta["measurement"])
+            )
+        else:
+            diff = False
+            for (k, v) in dump_meta["types"].items():
+                if k in types \
+                        and v != types[k]:
+                    diff = True
+                    break
+
+            if diff is True:
+                lines.append(
+                    "X {}\n".format(dump_meta["measurement"])
+                )
+            else:
+                lines.append(
+                    "* {}\n".format(dump_meta["measurement"])
+                )
+
+            if verbose is True:
+                lines.append(
+                    "dump: {}\n".format(dump_meta["types"])
+                )
+                lines.append(
+                    "db  : {}\n".format(types)
+                )
+
+    return lines
+
+
 def main():
     args = get_args()
     verbose = args["verbose"]
     
+    schema = get_schema(
+            host=args["host"],
+            port=args["port"],
+            db=args["db"],
+            path=args["schema_cache"],
+            ttl=args["schema_ttl"],
+    )
     client = get_client(
             host=args["host"],
             port=args["port"],
@@ -69,13 +158,9 @@ def main():
             pwd=args["pwd"],
             db=args["db"],
             legacy=args["legacy"],
+            schema=schema,
     )
 
-    if args["measurements"]:
-        pattern = re.compile(args["measurements"])
-    else:
-        pattern = None
-
     if verbose is True:
         sys.stdout.write(
             "# Unknown measurement\n"
@@ -85,65 +170,20 @@ def main():
             "\n"
         )
 
-    for entry in os.scandir(args["folder"]):
-        if entry.is_dir():
-            if pattern is not None and not pattern.search(entry.name):
-                continue
-
-            for filename in os.scandir(entry.path):
-                if not filename.name.endswith('.json'):
-                    continue
-
-                if verbose is True:
-                    sys.stdout.write(
-                        "> test casting for {}\n".format(filename.name))
+    groups = group_chunks(list_chunks(args["folder"], args["measurements"]))
+    if client.has_tags is True:
+        client.schema.discover(client, [m for (m, _) in groups], tags=False)
 
-                with open(filename.path, 'r') as fd:
-                    data = json.load(fd)
-
-                q = Query(
-                    data["meta"]["measurement"],
-                    q=data["meta"]["query"],
-                    ctx=data["meta"]["context"],
-                )
-                meta = get_meta(client, q, typecast=True)
-                # Measurement does not exist in db
-                if meta["types"] == {}:
-                    sys.stdout.write(
-                        "# {}\n".format(data["meta"]["measurement"])
-                    )
-                    continue
-
-                # Measurement does not exist in db
-                if meta["types"] == data["meta"]["types"]:
-                    sys.stdout.write(
-                        "= {}\n".format(data["meta"]["measurement"])
-                    )
-                else:
-                    diff = False
-                    for (k, v) in data["meta"]["types"].items():
-                        if k in meta["types"] \
-                                and v != meta["types"][k]:
-                            diff = True
-                            break
-
-                    if diff is True:
-                        sys.stdout.write(
-                            "X {}\n".format(data["meta"]["measurement"])
-                        )
-                    else:
-                        sys.stdout.write(
-                            "* {}\n".format(data["meta"]["measurement"])
-                        )
-
-                    if verbose is True:
-                        sys.stdout.write(
-                            "dump: {}\n".format(data["meta"]["types"])
-                        )
-                        sys.stdout.write(
-                            "db  : {}\n".format(meta["types"])
-                        )
+    # field types are looked up once per measurement, chunk files are
+    # checked against them by measurement
+    results = run_processes(check_chunks, [
+        (items, get_meta(client, Query(m), typecast=True, tags=False)["types"])
+        for (m, items) in groups
+    ], args["jobs"], verbose=verbose)
+    for lines in results:
+        sys.stdout.write("".join(lines))
 
+    schema.save()
 
 if __name__ == "__main__":
     try:
@@ -153,3 +193,6 @@ if __name__ == "__main__":
         influxdb < 1.0 did not provide key types when queried.
         """)
         sys.exit(1)
+    except CompressionError as e:
+        sys.stderr.write("{}\n".format(e))
+        sys.exit(1)
@@ -4,9 +4,28 @@ import getpass
 import json
 import sys
 
-from influxdump.data import dump_data, load_file, load_folder
-from influxdump.db import get_client
-from influxdump.exceptions import TypecastError
+from influxdump.compression import parse_compression
+from influxdump.data import (
+    PROBES,
+    SMALL_BATCH,
+    copy_data,
+    dump_data,
+    load_file,
+    load_folder,
+)
+from influxdump.db import (
+    POOLSIZE,
+    SCHEMA_TTL,
+    get_client,
+    get_schema,
+    parse_duration,
+)
+from influxdump.exceptions import (
+    CompressionError,
+    ManifestError,
+    TypecastError,
+)
+from influxdump.sizing import MEMORY_BUDGET, TARGET_LATENCY
 
 
 CHUNKSIZE = 50000
@@ -14,15 +33,73 @@ CHUNKSIZE = 50000
 
 def get_args():
     parser = argparse.ArgumentParser(description='influxDB data backup tool')
+    parser.add_argument('--adaptive', action="store_true",
+            help="""
+            adapt the chunk size of dump queries (per measurement) and the
+            batch size of writes to the observed latency and memory use,
+            see --target-latency and --memory-budget
+            """)
+    parser.add_argument('--backend', default='requests',
+            choices=['requests', 'asyncio'],
+            help="""
+            http client backend, 'requests' (influxdb library) or 'asyncio'
+            (requests of all workers share an event loop and a pool of
+            keep-alive connections), defaults to 'requests'
+            """)
+    parser.add_argument('--batch-small', default=None, type=int,
+            metavar='POINTS',
+            help="""
+            dump measurements (or time windows) of at most POINTS points
+            with multi-statement queries of {} statements, saving
+            round-trips on databases with many small measurements
+            """.format(SMALL_BATCH))
     parser.add_argument('-c', '--chunksize',
             help='query chunk size, default to {}'.format(CHUNKSIZE),
             type=int, default=CHUNKSIZE)
+    parser.add_argument('--connect-timeout', default=None, type=float,
+            help="connection timeout in seconds, defaults to no timeout")
     parser.add_argument('-d', '--database', help='database', required=True,
             type=str)
+    parser.add_argument('--dest-database', default=None,
+            help="""
+            copy: destination database, defaults to --database
+            """)
+    parser.add_argument('--dest-host', default=None,
+            help="""
+            copy: destination server host, defaults to --host
+            """)
+    parser.add_argument('--dest-password', default=None,
+            help="""
+            copy: destination password, defaults to the source password
+            """)
+    parser.add_argument('--dest-port', default=None, type=int,
+            help="""
+            copy: destination server port, defaults to --port
+            """)
+    parser.add_argument('--dest-user', default=None,
+            help="""
+            copy: destination username, defaults to --user
+            """)
     parser.add_argument('-e', '--end', default='', type=str,
             help="""
             Exclude all results after the specified timestamp (RFC3339 format).
             """)
+    parser.add_argument('--compress', default=None, type=parse_compression,
+            metavar='CODEC[:LEVEL]',
+            help="""
+            compress fragment files of a dump folder with 'gzip', 'zstd' or
+            'lz4' (the last two need the 'zstandard' or 'lz4' packages), with
+            an optional compression level, e.g. 'zstd:10'. Compressed files
+            are recognised from their extension when loading
+            """)
+    parser.add_argument('--format', default='json',
+            choices=['json', 'lp', 'col'],
+            help="""
+            dump format, 'json', 'lp' (line protocol) or 'col' (columnar
+            binary, needs a dump folder), defaults to 'json'. With 'lp' and
+            'col', field types are always discovered. With 'lp', chunk metadata
+            is written in a '.meta' file next to each fragment
+            """)
     parser.add_argument('-F', '--folder', default=None,
             help="""
             destination folder for fragmented dump, if this flag is not used
@@ -30,25 +107,117 @@ def get_args():
             """)
     parser.add_argument('-H', '--host', help='server host',
             default="localhost", type=str)
+    parser.add_argument('--http-gzip', action="store_true",
+            help="""
+            compress http request and response bodies with gzip, much faster
+            on network bound transfers
+            """)
     parser.add_argument('-i', '--input', default=None,
             help="data/metadata input file, will force action to 'load'")
+    parser.add_argument('-I', '--incremental', action="store_true",
+            help="""
+            incremental dump: dump in a new generation folder of --folder only
+            the points newer than the ones of previous generations. Loading a
+            folder of generations replays them in order
+            """)
+    parser.add_argument('-j', '--jobs', default=1, type=int,
+            help="""
+            number of concurrent workers, each one using its own connection,
+            defaults to 1. When dumping, measurements (or time windows) are
+            dumped concurrently. When loading a folder, chunk files are parsed
+            by this number of readers and written by this number of writers,
+            as are the queries of a copy
+            """)
+    parser.add_argument('--journal', default=None,
+            help="""
+            load journal file recording written batches so that the load can
+            be resumed, defaults to 'load-journal.jsonl' in --folder with
+            --resume. Loads without --journal nor --resume are not journaled
+            """)
     parser.add_argument('-L', '--legacy', action="store_true",
             help='influxdb legacy client (<=0.8)')
     parser.add_argument('-m', '--measurements', help='measurement pattern')
+    parser.add_argument('--memory-budget', default=MEMORY_BUDGET >> 20,
+            type=int, metavar='MB',
+            help="""
+            adaptive mode: maximum memory held by a chunk or a write batch,
+            in MB, defaults to {}
+            """.format(MEMORY_BUDGET >> 20))
+    parser.add_argument('--msgpack', action="store_true",
+            help="""
+            ask for msgpack query responses, cheaper to decode than json
+            (influxdb >= 1.4, older servers answer with json)
+            """)
     parser.add_argument('-n', '--dry-run', help='do not really do anything',
             action="store_true")
     parser.add_argument('-p', '--port', help='server port', default=8086,
             type=int)
+    parser.add_argument('--pool-size', default=POOLSIZE, type=int,
+            help="""
+            number of http connections kept alive per client, defaults to {}.
+            With the 'asyncio' backend it bounds the number of requests in
+            flight
+            """.format(POOLSIZE))
+    parser.add_argument('--probe', default='count', choices=PROBES,
+            help="""
+            how queries without data are detected before dumping: 'count'
+            (COUNT(*) per measurement, scans the data), 'limit' (LIMIT 1 per
+            measurement), 'batch' (LIMIT 1 queries in multi-statement
+            queries) or 'cardinality' (one SHOW SERIES EXACT CARDINALITY
+            query), defaults to 'count'
+            """)
+    parser.add_argument('-P', '--protocol', default='json',
+            choices=['json', 'line'],
+            help="""
+            write protocol used by 'load' and 'copy', 'line' encodes records directly in
+            line protocol which is much cheaper than building json points,
+            defaults to 'json'
+            """)
+    parser.add_argument('--read-timeout', default=None, type=float,
+            help="""
+            timeout in seconds waiting for the server, defaults to no timeout
+            """)
     parser.add_argument('-r', '--retry', default=0, type=int,
             help="""
             Retry a dump query in case of problem, 0 to disable, defaults to 0
             """)
+    parser.add_argument('--resume', action="store_true",
+            help="""
+            resume an interrupted dump in --folder: completed measurements are
+            skipped and partial ones restart from their last committed chunk.
+            When loading a folder, files and batches recorded in the load
+            journal are skipped, and the load is journaled so that it can be
+            resumed in turn
+            """)
     parser.add_argument('-s', '--start', default='', type=str,
             help="""
             Include all points starting with the specified timestamp (RFC3339
             format).
             If used without --start, all data will be backed up starting from
-            1970-01-01T00:00:00Z
+            1970-01-01T00:00:00Z.
+            When loading a folder, --start and --end restrict the loaded
+            points, only the chunks of the folder catalogue having points in
+            the range are read
+            """)
+    parser.add_argument('--schema-cache', default=None,
+            help="""
+            schema snapshot file (measurements, field types and tag keys),
+            reused by later runs until it expires, created if missing
+            """)
+    parser.add_argument('--schema-ttl', default=SCHEMA_TTL, type=int,
+            help="""
+            number of seconds after which the schema snapshot is discovered
+            again, defaults to {}
+            """.format(SCHEMA_TTL))
+    parser.add_argument('--shard-width', default=None, type=parse_duration,
+            help="""
+            split each measurement in time windows of fixed width (e.g. 6h,
+            7d) that are dumped independently
+            """)
+    parser.add_argument('--shard-size', default=None, type=int,
+            help="""
+            split each measurement in time windows of about this number of
+            points, sized from the point count of the measurement
             """)
     parser.add_argument('-t', '--typecast',
             help="""
@@ -62,6 +231,12 @@ def get_args():
             File containing casting definitions, will supersede any other type
             cast definition
             """, type=str, default='')
+    parser.add_argument('--target-latency', default=TARGET_LATENCY,
+            type=float, metavar='SECONDS',
+            help="""
+            adaptive mode: target duration of a chunk query or a write,
+            defaults to {}
+            """.format(TARGET_LATENCY))
     parser.add_argument('-u', '--user', help='username', default='', type=str)
     parser.add_argument('-v', '--verbose', help='make the script verbose',
             action="store_true")
@@ -71,10 +246,12 @@ def get_args():
             action="store_true")
     parser.add_argument('action', metavar="action", nargs="?", default='dump',
             help="""
-            action, can be 'dump' or 'load', default to 'dump'. If action is
-            'load', one input file (--input) or a folder with data to load has
-            to be provided
-            """, choices=["load", "dump"])
+            action, can be 'dump', 'load' or 'copy', default to 'dump'. If
+            action is 'load', one input file (--input) or a folder with data
+            to load has to be provided. The 'copy' action writes the points of
+            the database straight into the destination database (see the
+            --dest-* options) without dump files
+            """, choices=["load", "dump", "copy"])
     args = parser.parse_args()
 
     if args.pwdprompt is True:
@@ -91,6 +268,70 @@ def get_args():
     else:
         cast = {}
 
+    if args.shard_width is not None and args.shard_size is not None:
+        sys.stderr.write("Use either --shard-width or --shard-size\n\n")
+        parser.print_help()
+        sys.exit(1)
+
+    if args.format == 'col' and args.folder is None:
+        sys.stderr.write("Columnar format needs a dump folder\n\n")
+        parser.print_help()
+        sys.exit(1)
+
+    if args.incremental is True and args.folder is None:
+        sys.stderr.write("Incremental dumps need a dump folder\n\n")
+        parser.print_help()
+        sys.exit(1)
+
+    if args.resume is True and args.folder is None:
+        sys.stderr.write("Resuming needs a dump folder\n\n")
+        parser.print_help()
+        sys.exit(1)
+
+    if args.compress is not None and args.folder is None:
+        sys.stderr.write("Compression needs a dump folder\n\n")
+        parser.print_help()
+        sys.exit(1)
+
+    if args.compress is not None:
+        (compress, compress_level) = args.compress
+    else:
+        (compress, compress_level) = (None, None)
+
+    if args.legacy is True and args.protocol == 'line':
+        sys.stderr.write("Line protocol is not supported by legacy client\n\n")
+        parser.print_help()
+        sys.exit(1)
+
+    if args.connect_timeout is not None or args.read_timeout is not None:
+        timeout = (args.connect_timeout, args.read_timeout)
+    else:
+        timeout = None
+
+    if args.legacy is True and args.backend == 'asyncio':
+        sys.stderr.write("asyncio backend is not supported by legacy client\n\n")
+        parser.print_help()
+        sys.exit(1)
+
+    dest = {
+        "host": args.dest_host or args.host,
+        "port": args.dest_port or args.port,
+        "db": args.dest_database or args.database,
+        "user": args.user if args.dest_user is None else args.dest_user,
+        "pwd": pwd if args.dest_password is None else args.dest_password,
+    }
+    if args.action == "copy" \
+            and (dest["host"], dest["port"], dest["db"]) \
+            == (args.host, args.port, args.database):
+        sys.stderr.write("Copy destination is the source database\n\n")
+        parser.print_help()
+        sys.exit(1)
+
+    if args.action == "copy" and args.input is not None:
+        sys.stderr.write("Action is copy, input file is not used\n\n")
+        parser.print_help()
+        sys.exit(1)
+
     if args.action == "load" \
             and args.input is None and args.folder is None:
         sys.stderr.write("Action is load, missing input file or folder\n\n")
@@ -99,18 +340,41 @@ def get_args():
 
 
     return {
+        "adaptive": args.adaptive,
+        "backend": args.backend,
+        "batch_small": args.batch_small,
         "chunksize": args.chunksize,
+        "compress": compress,
+        "compress_level": compress_level,
         "db": args.database,
+        "dest": dest,
         "end": args.end,
         "folder": args.folder,
+        "format": args.format,
+        "gzip": args.http_gzip,
         "host": args.host,
+        "incremental": args.incremental,
         "input": args.input,
+        "jobs": args.jobs,
+        "journal": args.journal,
         "legacy": args.legacy,
         "measurements": args.measurements,
+        "memory_budget": args.memory_budget << 20,
+        "msgpack": args.msgpack,
         "dryrun": args.dry_run,
         "port": args.port,
+        "pool_size": args.pool_size,
+        "probe": args.probe,
+        "protocol": args.protocol,
+        "resume": args.resume,
         "retry": args.retry,
+        "schema_cache": args.schema_cache,
+        "schema_ttl": args.schema_ttl,
+        "shard_size": args.shard_size,
+        "shard_width": args.shard_width,
         "start": args.start,
+        "target_latency": args.target_latency,
+        "timeout": timeout,
         "user": args.user,
         "verbose": args.verbose,
         "pwd": pwd,
@@ -132,7 +396,20 @@ def dump(args, client):
         retry=args["retry"],
         typecast=args["typecast"],
         cast=args["cast"],
-        verbose=args["verbose"]
+        verbose=args["verbose"],
+        jobs=args["jobs"],
+        shard_width=args["shard_width"],
+        shard_size=args["shard_size"],
+        fmt=args["format"],
+        compress=args["compress"],
+        compress_level=args["compress_level"],
+        resume=args["resume"],
+        incremental=args["incremental"],
+        probe=args["probe"],
+        batch_small=args["batch_small"],
+        adaptive=args["adaptive"],
+        target_latency=args["target_latency"],
+        memory_budget=args["memory_budget"]
     )
 
 
@@ -143,7 +420,8 @@ def load(args, client):
             args["input"],
             typecast=args["typecast"],
             cast=args["cast"],
-            verbose=args["verbose"]
+            verbose=args["verbose"],
+            protocol=args["protocol"]
         )
     else:
         load_folder(
@@ -152,12 +430,62 @@ def load(args, client):
             pattern=args["measurements"],
             typecast=args["typecast"],
             cast=args["cast"],
-            verbose=args["verbose"]
+            verbose=args["verbose"],
+            jobs=args["jobs"],
+            protocol=args["protocol"],
+            resume=args["resume"],
+            journal_path=args["journal"],
+            adaptive=args["adaptive"],
+            target_latency=args["target_latency"],
+            memory_budget=args["memory_budget"],
+            start=args["start"],
+            end=args["end"]
         )
 
 
+def copy(args, client):
+    dest = get_client(
+            host=args["dest"]["host"],
+            port=args["dest"]["port"],
+            user=args["dest"]["user"],
+            pwd=args["dest"]["pwd"],
+            db=args["dest"]["db"],
+            legacy=args["legacy"],
+            backend=args["backend"],
+            gzip=args["gzip"],
+            msgpack=args["msgpack"],
+            pool_size=args["pool_size"],
+            timeout=args["timeout"],
+    )
+    copy_data(
+        client,
+        dest,
+        args["measurements"],
+        dryrun=args["dryrun"],
+        chunk_size=args["chunksize"],
+        start=args["start"],
+        end=args["end"],
+        retry=args["retry"],
+        typecast=args["typecast"],
+        cast=args["cast"],
+        verbose=args["verbose"],
+        jobs=args["jobs"],
+        shard_width=args["shard_width"],
+        shard_size=args["shard_size"],
+        protocol=args["protocol"],
+        probe=args["probe"]
+    )
+
+
 def main():
     args = get_args()
+    schema = get_schema(
+            host=args["host"],
+            port=args["port"],
+            db=args["db"],
+            path=args["schema_cache"],
+            ttl=args["schema_ttl"],
+    )
     client = get_client(
             host=args["host"],
             port=args["port"],
@@ -165,12 +493,23 @@ def main():
             pwd=args["pwd"],
             db=args["db"],
             legacy=args["legacy"],
+            schema=schema,
+            backend=args["backend"],
+            gzip=args["gzip"],
+            msgpack=args["msgpack"],
+            pool_size=args["pool_size"],
+            timeout=args["timeout"],
     )
 
-    if args["action"] == "load" or args["input"] is not None:
-        load(args, client)
-    else:
-        dump(args, client)
+    try:
+        if args["action"] == "load" or args["input"] is not None:
+            load(args, client)
+        elif args["action"] == "copy":
+            copy(args, client)
+        else:
+            dump(args, client)
+    finally:
+        schema.save()
 
 
 if __name__ == "__main__":
@@ -181,3 +520,6 @@ if __name__ == "__main__":
         influxdb < 1.0 did not provide key types when queried.
         """)
         sys.exit(1)
+    except (CompressionError, ManifestError) as e:
+        sys.stderr.write("{}\n".format(e))
+        sys.exit(1)
@@ -5,12 +5,24 @@ import argparse
 import getpass
 import json
 import os
-import re
 import sys
 
-from influxdump.data import get_meta
-from influxdump.db import Query, get_client
-from influxdump.exceptions import TypecastError
+from influxdump.catalogue import Catalogue
+from influxdump.data import (
+    get_format,
+    get_meta,
+    group_chunks,
+    list_chunks,
+    read_meta,
+    run_processes,
+    write_meta,
+)
+from influxdump.db import SCHEMA_TTL, Query, get_client, get_schema
+from influxdump.exceptions import (
+    CompressionError,
+    RecastError,
+    TypecastError,
+)
 
 
 def get_args():
@@ -19,6 +31,11 @@ def get_args():
             type=str)
     parser.add_argument('-H', '--host', help='server host',
             default="localhost", type=str)
+    parser.add_argument('-j', '--jobs', default=1, type=int,
+            help="""
+            number of processes recasting measurements concurrently, defaults
+            to 1
+            """)
     parser.add_argument('-L', '--legacy', action="store_true",
             help='influxdb legacy client (<=0.8)')
     parser.add_argument('-m', '--measurements', help='measurement pattern')
@@ -35,6 +52,16 @@ def get_args():
             File containing casting definitions, will supersede any other type
             cast definition
             """, type=str, default='')
+    parser.add_argument('--schema-cache', default=None,
+            help="""
+            schema snapshot file (measurements, field types and tag keys),
+            reused by later runs until it expires, created if missing
+            """)
+    parser.add_argument('--schema-ttl', default=SCHEMA_TTL, type=int,
+            help="""
+            number of seconds after which the schema snapshot is discovered
+            again, defaults to {}
+            """.format(SCHEMA_TTL))
     parser.add_argument('-u', '--user', help='username', default='', type=str)
     parser.add_argument('-v', '--verbose', help='make the script verbose',
             action="store_true")
@@ -74,11 +101,14 @@ def get_args():
     return {
         "db": args.database,
         "host": args.host,
+        "jobs": args.jobs,
         "legacy": args.legacy,
         "measurements": args.measurements,
         "dryrun": args.dry_run,
         "port": args.port,
         "retry": args.retry,
+        "schema_cache": args.schema_cache,
+        "schema_ttl": args.schema_ttl,
         "user": args.user,
         "verbose": args.verbose,
         "pwd": pwd,
@@ -87,6 +117,57 @@ def get_args():
     }
 
 
+def recast_chunks(group, dryrun=False, verbose=False):
+    """Recast the chunk files of a measurement, `group` being the
+    `(datafile, chunk)` items of the measurement and its new field types.
+
+    Line protocol chunks are not recast, their values are encoded with the
+    types they were dumped with.
+
+    :returns: a `(lines, recast, refused)` tuple, `lines` being the lines of
+        the report, `recast` the `(datafile, meta)` of recast catalogued chunks
+        and `refused` the line protocol chunks whose types would change
+    """
+    (items, types) = group
+    lines = []
+    recast = []
+    refused = []
+    for (datafile, chunk) in items:
+        if verbose is True:
+            lines.append(
+                "> recasting {}\n".format(os.path.basename(datafile)))
+
+        # skip dumps we can't recast
+        if types == {}:
+            if verbose is True:
+                lines.append(
+                    "  no casting change\n")
+            continue
+
+        if chunk is not None:
+            dump_meta = dict(chunk["meta"])
+        else:
+            dump_meta = read_meta(datafile)
+
+        if get_format(datafile) == 'lp' \
+                and dump_meta.get("types") != types:
+            refused.append(datafile)
+            continue
+
+        if verbose is True:
+            lines.append(
+                "  new casting: {}\n".format(types))
+
+        dump_meta["types"] = types
+
+        if dryrun is False:
+            write_meta(datafile, dump_meta)
+            if chunk is not None:
+                recast.append((datafile, dump_meta))
+
+    return (lines, recast, refused)
+
+
 def main():
     args = get_args()
     verbose = args["verbose"]
@@ -95,6 +176,13 @@ def main():
     if args["db"] is None:
         client = None
     else:
+        schema = get_schema(
+                host=args["host"],
+                port=args["port"],
+                db=args["db"],
+                path=args["schema_cache"],
+                ttl=args["schema_ttl"],
+        )
         client = get_client(
                 host=args["host"],
                 port=args["port"],
@@ -102,55 +190,47 @@ def main():
                 pwd=args["pwd"],
                 db=args["db"],
                 legacy=args["legacy"],
+                schema=schema,
         )
 
     cast = args["cast"]
-
-    if args["measurements"]:
-        pattern = re.compile(args["measurements"])
-    else:
-        pattern = None
-
-    for entry in os.scandir(args["folder"]):
-        if entry.is_dir():
-            if pattern is not None \
-                    and pattern.search(entry.name) is None:
-                continue
-
-            for filename in os.scandir(entry.path):
-                if not filename.name.endswith('.json'):
-                    continue
-
-                if verbose is True:
-                    sys.stdout.write(
-                        "> recasting {}\n".format(filename.name))
-
-                with open(filename.path, 'r') as fd:
-                    data = json.load(fd)
-
-                q = Query(
-                    data["meta"]["measurement"],
-                    q=data["meta"]["query"],
-                    ctx=data["meta"]["context"],
-                )
-                meta = get_meta(client, q, typecast=True, cast=cast)
-                # skip dumps we can't recast
-                if meta["types"] == {}:
-                    if verbose is True:
-                        sys.stdout.write(
-                            "  no casting change\n")
-                    continue
-
-                if verbose is True:
-                    sys.stdout.write(
-                        "  new casting: {}\n".format(meta["types"]))
-
-                data["meta"]["types"] = meta["types"]
-
-                if dryrun is False:
-                    with open(filename.path, 'w') as fd:
-                        json.dump(data, fd)
-
+    groups = group_chunks(list_chunks(args["folder"], args["measurements"]))
+    if client is not None and cast == {} and client.has_tags is True:
+        client.schema.discover(client, [m for (m, _) in groups], tags=False)
+
+    # field types are looked up once per measurement, chunk files are
+    # recast by measurement
+    results = run_processes(recast_chunks, [
+        (items, get_meta(client, Query(m), typecast=True, cast=cast,
+            tags=False)["types"])
+        for (m, items) in groups
+    ], args["jobs"], dryrun=dryrun, verbose=verbose)
+
+    catalogues = {}
+    refused = []
+    for (lines, recast, _refused) in results:
+        sys.stdout.write("".join(lines))
+        refused.extend(_refused)
+        for (datafile, meta) in recast:
+            # chunk files are in measurement directories of the folder
+            folder = os.path.dirname(os.path.dirname(datafile))
+            if folder not in catalogues:
+                catalogues[folder] = Catalogue(folder).load()
+            catalogues[folder].update(datafile, meta)
+
+    for catalogue in catalogues.values():
+        catalogue.save()
+
+    if client is not None:
+        client.schema.save()
+
+    if refused:
+        for datafile in refused:
+            sys.stderr.write("> cannot recast {}\n".format(datafile))
+        raise RecastError(
+            "{} line protocol chunks not recast, their values are encoded "
+            "with the types they were dumped with, dump them again with the "
+            "new types or in another format".format(len(refused)))
 
 if __name__ == "__main__":
     try:
@@ -160,3 +240,6 @@ if __name__ == "__main__":
         influxdb < 1.0 did not provide key types when queried.
         """)
         sys.exit(1)
+    except (CompressionError, RecastError) as e:
+        sys.stderr.write("{}\n".format(e))
+        sys.exit(1)
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""Cast plans of field values.
+
+A cast map gives the type of fields by name, `'*'` being the type of fields
+not listed. Rather than resolving it for each value, it is compiled once per
+set of columns in a plan: the list of `(name, converter)` pairs of the columns
+to cast. Plans are applied to whole batches of records, numeric columns are
+converted with numpy when it is installed.
+"""
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+CONVERTERS = {
+    'int': int,
+    'float': float,
+    'bool': bool,
+    'str': str,
+}
+
+# minimum size of the columns converted with numpy, below it the array
+# round trip costs more than it saves
+VECTOR_SIZE = 64
+
+
+def compile_cast(cast, names, tags=()):
+    """Return the cast plan of columns `names`, the `(name, converter)` pairs
+    of the columns to cast. `time` and tag columns are never cast.
+    """
+    if not cast:
+        return []
+
+    default = cast.get('*')
+    plan = []
+    for name in names:
+        if name == 'time' or name in tags:
+            continue
+        _type = cast.get(name, default)
+        if _type is not None:
+            plan.append((name, CONVERTERS[_type]))
+    return plan
+
+
+def _vector_cast(column, converter):
+    """Convert a column without `None` with numpy, return None when numpy
+    would not give the same values as `converter`.
+    """
+    try:
+        values = numpy.asarray(column)
+    except (ValueError, TypeError, OverflowError):
+        return None
+    if values.ndim != 1 or values.dtype.kind not in 'biuf':
+        return None
+
+    if converter is float:
+        return values.astype(numpy.float64).tolist()
+    # floats mixed with large ints lose precision in a float array and
+    # unsigned ints of 2**63 and more wrap around in an int64 array, they are
+    # only cast to int one by one
+    if converter is int and values.dtype.kind in 'bi':
+        return values.astype(numpy.int64).tolist()
+    return None
+
+
+def cast_column(column, converter):
+    """Cast the values of a column, `None` values are kept"""
+    if numpy is not None \
+            and converter in (int, float) \
+            and len(column) >= VECTOR_SIZE \
+            and None not in column:
+        values = _vector_cast(column, converter)
+        if values is not None:
+            return values
+    return [converter(v) if v is not None else None for v in column]
+
+
+def cast_records(records, plan):
+    """Apply a cast plan to a batch of records, in place, column by column"""
+    if not plan or not records:
+        return records
+
+    for (name, converter) in plan:
+        column = cast_column([r.get(name) for r in records], converter)
+        for (record, value) in zip(records, column):
+            if value is not None:
+                record[name] = value
+    return records
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""Catalogue of the chunks of a dump folder.
+
+The catalogue is a json file written once a dump is complete, listing for
+each chunk file its metadata, record count, time of its first and last
+records, size and checksum. It is removed when a dump starts writing in the
+folder, an interrupted dump leaves no stale catalogue. Tools plan their work
+from it without opening chunk files, and loads restricted to measurements or
+to a time range only open the chunks they need. Folders without a catalogue
+(older dumps, interrupted dumps) are scanned instead.
+"""
+import io
+import json
+import os
+import re
+import zlib
+
+from .lineprotocol import rfc3339_to_ns
+
+
+CATALOGUE = "catalogue.json"
+
+BLOCKSIZE = 1 << 20
+
+
+def checksum(path):
+    """Return the crc32 checksum of a file"""
+    crc = 0
+    with open(path, 'rb') as fd:
+        while True:
+            block = fd.read(BLOCKSIZE)
+            if not block:
+                break
+            crc = zlib.crc32(block, crc)
+    return "crc32:{:08x}".format(crc & 0xffffffff)
+
+
+def describe(datafile):
+    """Return the `size` and `checksum` entries of a chunk file, for chunks
+    not written with a `ChecksumWriter`.
+    """
+    return {
+        "size": os.path.getsize(datafile),
+        "checksum": checksum(datafile),
+    }
+
+
+class ChecksumWriter(io.BufferedWriter):
+    """Binary file writer computing the `describe` entries of a file as it is
+    written, so that chunk files are not read back once written.
+    """
+    def __init__(self, path):
+        super().__init__(io.FileIO(path, 'wb'))
+        self.size = 0
+        self._crc = 0
+
+    def write(self, data):
+        data = memoryview(data).cast('B')
+        self._crc = zlib.crc32(data, self._crc)
+        self.size += len(data)
+        return super().write(data)
+
+    def describe(self):
+        return {
+            "size": self.size,
+            "checksum": "crc32:{:08x}".format(self._crc & 0xffffffff),
+        }
+
+
+def get_window(start='', end=''):
+    """Return the `(start, end)` nanosecond boundaries of a time range given
+    with RFC3339 timestamps, None for an open boundary.
+    """
+    return (
+        rfc3339_to_ns(start) if start else None,
+        rfc3339_to_ns(end) if end else None,
+    )
+
+
+def in_window(ns, window):
+    """Test if a nanosecond timestamp is in a time range, boundaries
+    included.
+    """
+    (start, end) = window
+    return (start is None or ns >= start) and (end is None or ns <= end)
+
+
+class Catalogue(object):
+    def __init__(self, folder):
+        self.folder = folder
+        self.path = os.path.join(folder, CATALOGUE)
+        self.chunks = {}
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def load(self):
+        """Read the catalogue of the folder, if any"""
+        if not self.exists():
+            return self
+        with open(self.path, 'r') as fd:
+            for chunk in json.load(fd)["chunks"]:
+                self.chunks[chunk["file"]] = chunk
+        return self
+
+    def remove(self):
+        """Remove the catalogue of the folder, if any"""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def save(self):
+        """Write the catalogue, atomically so that it is never partial"""
+        tmp = self.path + ".tmp"
+        with open(tmp, 'w') as fd:
+            json.dump({
+                "chunks": [self.chunks[k] for k in sorted(self.chunks)],
+            }, fd)
+        os.replace(tmp, self.path)
+
+    def add(self, datafile, meta, records, first, last, info=None):
+        """Add a chunk file, `info` being its `describe` entries, computed
+        when missing.
+        """
+        chunk = {
+            "file": os.path.relpath(datafile, self.folder),
+            "measurement": meta["measurement"],
+            "records": records,
+            "first": first,
+            "last": last,
+            "meta": meta,
+        }
+        chunk.update(info or describe(datafile))
+        self.chunks[chunk["file"]] = chunk
+
+    def get(self, datafile):
+        return self.chunks.get(os.path.relpath(datafile, self.folder))
+
+    def update(self, datafile, meta):
+        """Replace the metadata of a chunk, its file is unchanged"""
+        self.get(datafile)["meta"] = meta
+
+    def select(self, pattern=None, window=None):
+        """Return the chunks of measurements matching `pattern` having records
+        in the `(start, end)` nanosecond range `window`, in file order.
+        """
+        _pattern = re.compile(pattern) if pattern else None
+        chunks = []
+        for key in sorted(self.chunks):
+            chunk = self.chunks[key]
+            if _pattern is not None \
+                    and _pattern.search(chunk["measurement"]) is None:
+                continue
+            if window is not None and not self.overlaps(chunk, window):
+                continue
+            chunks.append(chunk)
+        return chunks
+
+    @staticmethod
+    def overlaps(chunk, window):
+        if chunk["first"] is None or chunk["last"] is None:
+            return False
+        (start, end) = window
+        return (start is None or rfc3339_to_ns(chunk["last"]) >= start) \
+                and (end is None or rfc3339_to_ns(chunk["first"]) <= end)
+
+    @staticmethod
+    def contained(chunk, window):
+        """Test if all the records of a chunk are in `window`"""
+        return in_window(rfc3339_to_ns(chunk["first"]), window) \
+                and in_window(rfc3339_to_ns(chunk["last"]), window)
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""Columnar binary chunk format.
+
+A chunk file holds a json header followed by one section per column: a time
+column of nanosecond timestamps, then one typed column per field::
+
+    MAGIC | header size (uint32) | header (json) | time column | field columns
+
+Each field column starts with a validity bitmap (one bit per record, unset for
+null values) followed by the values: packed little-endian integers, floats or
+booleans, utf-8 strings with their offsets, or a json list for fields whose
+type is unknown or mixed.
+"""
+from array import array
+import json
+import struct
+import sys
+
+from .cast import CONVERTERS, cast_column, compile_cast
+from .lineprotocol import rfc3339_to_ns
+
+
+MAGIC = b'IDMPCOL1'
+
+TYPECODES = {
+    'int': 'q',
+    'float': 'd',
+    'bool': 'b',
+}
+
+_SIZE = struct.Struct('<I')
+
+
+def _to_bytes(values):
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_bytes(typecode, data):
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+def guess_type(values):
+    """Guess the type of a column from its values, `json` if values have
+    different types.
+    """
+    types = set(type(v) for v in values if v is not None)
+    if len(types) != 1:
+        return 'json'
+    _type = types.pop()
+    for (name, converter) in CONVERTERS.items():
+        if _type is converter:
+            return name
+    return 'json'
+
+
+def build_columns(records, types={}, tags=()):
+    """Transpose records in a time column and a dict of field columns, tag
+    columns listed in `tags` are string columns.
+
+    :returns: a `(times, columns, types)` tuple, `types` being the type of
+        each column, taken from `types` or guessed from values
+    """
+    times = array('q')
+    columns = {}
+    for record in records:
+        n = len(times)
+        times.append(rfc3339_to_ns(record['time']))
+        for (name, value) in record.items():
+            if name == 'time':
+                continue
+            column = columns.get(name)
+            if column is None:
+                column = columns[name] = [None] * n
+            column.append(value)
+        # fields missing from this record
+        for column in columns.values():
+            if len(column) <= n:
+                column.append(None)
+
+    column_types = {}
+    for (name, column) in columns.items():
+        if name in tags:
+            column_types[name] = 'str'
+            continue
+        _type = types.get(name, types.get('*'))
+        if _type not in CONVERTERS:
+            _type = guess_type(column)
+        column_types[name] = _type
+
+    return (times, columns, column_types)
+
+
+def _encode_column(values, _type):
+    validity = bytearray((len(values) + 7) // 8)
+    for (i, v) in enumerate(values):
+        if v is not None:
+            validity[i >> 3] |= 1 << (i & 7)
+
+    if _type in TYPECODES:
+        converter = CONVERTERS[_type]
+        data = _to_bytes(array(TYPECODES[_type],
+            (converter(v) if v is not None else 0 for v in values)))
+    elif _type == 'str':
+        encoded = [str(v).encode('utf-8') if v is not None else b''
+                for v in values]
+        offsets = array('q', [0])
+        for value in encoded:
+            offsets.append(offsets[-1] + len(value))
+        data = _to_bytes(offsets) + b''.join(encoded)
+    else:
+        data = json.dumps(values).encode('utf-8')
+
+    return bytes(validity) + data
+
+
+def _decode_column(section, _type, count):
+    size = (count + 7) // 8
+    validity = section[:size]
+    data = section[size:]
+
+    if _type in TYPECODES:
+        values = _from_bytes(TYPECODES[_type], data).tolist()
+        if _type == 'bool':
+            values = [v != 0 for v in values]
+    elif _type == 'str':
+        offsets = _from_bytes('q', data[:8 * (count + 1)])
+        blob = data[8 * (count + 1):]
+        values = [blob[offsets[i]:offsets[i + 1]].decode('utf-8')
+                for i in range(count)]
+    else:
+        return json.loads(data.decode('utf-8'))
+
+    for i in range(count):
+        if not validity[i >> 3] & (1 << (i & 7)):
+            values[i] = None
+    return values
+
+
+def write_columns(fd, meta, records):
+    """Write records as a columnar chunk on a binary file object, records are
+    typed with `meta["types"]` when available.
+
+    :returns: the number of records written
+    """
+    (times, columns, types) = build_columns(records, meta.get("types", {}),
+            meta.get("tags", ()))
+
+    sections = []
+    header = {
+        "meta": meta,
+        "count": len(times),
+        "columns": [],
+    }
+    for (name, column) in columns.items():
+        section = _encode_column(column, types[name])
+        header["columns"].append({
+            "name": name,
+            "type": types[name],
+            "size": len(section),
+        })
+        sections.append(section)
+
+    encoded = json.dumps(header).encode('utf-8')
+    fd.write(MAGIC)
+    fd.write(_SIZE.pack(len(encoded)))
+    fd.write(encoded)
+    fd.write(_to_bytes(times))
+    for section in sections:
+        fd.write(section)
+
+    return len(times)
+
+
+def read_header(fd):
+    """Read the header of a columnar chunk from a binary file object"""
+    if fd.read(len(MAGIC)) != MAGIC:
+        raise ValueError("Not a columnar chunk file")
+    (size,) = _SIZE.unpack(fd.read(_SIZE.size))
+    return json.loads(fd.read(size).decode('utf-8'))
+
+
+def read_columns(fd):
+    """Read a columnar chunk from a binary file object.
+
+    :returns: a `(meta, times, columns)` tuple, null values are None
+    """
+    header = read_header(fd)
+    count = header["count"]
+
+    times = _from_bytes('q', fd.read(8 * count)).tolist()
+    columns = {}
+    for column in header["columns"]:
+        section = fd.read(column["size"])
+        columns[column["name"]] = _decode_column(section, column["type"],
+                count)
+
+    return (header["meta"], times, columns)
+
+
+def cast_columns(columns, cast={}, tags=()):
+    """Cast columns with a cast plan (see `influxdump.cast`), numeric columns
+    are converted with numpy when it is installed. Tag columns are never cast.
+    """
+    if not cast:
+        return columns
+
+    casted = dict(columns)
+    for (name, converter) in compile_cast(cast, columns, tags):
+        casted[name] = cast_column(columns[name], converter)
+    return casted
+
+
+def iter_records(times, columns):
+    """Generator of records rebuilt from columns, with nanosecond timestamps"""
+    names = list(columns)
+    values = [columns[name] for name in names]
+    for (i, t) in enumerate(times):
+        record = {"time": t}
+        for (name, column) in zip(names, values):
+            record[name] = column[i]
+        yield record
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""Transparent compression of dump files.
+
+gzip is always available, zstd and lz4 need the optional `zstandard` and `lz4`
+packages. Compressed files are recognised from their extension.
+"""
+import gzip
+import io
+import queue
+import threading
+
+from .exceptions import CompressionError
+
+
+CODECS = {
+    'gzip': '.gz',
+    'zstd': '.zst',
+    'lz4': '.lz4',
+}
+
+# size of the blocks handed over to the compression thread
+BLOCKSIZE = 1 << 20
+
+
+def parse_compression(value):
+    """Parse a `codec[:level]` compression option, return a `(codec, level)`
+    tuple, level being None when not set.
+    """
+    (codec, _, level) = value.partition(':')
+    if codec not in CODECS:
+        raise ValueError("Unknown compression codec: {}".format(codec))
+    if level == '':
+        return (codec, None)
+    return (codec, int(level))
+
+
+def get_codec(path):
+    """Return the codec of a file from its name, None if not compressed"""
+    for (codec, suffix) in CODECS.items():
+        if path.endswith(suffix):
+            return codec
+    return None
+
+
+def strip_codec(path):
+    """Remove the compression extension from a file name"""
+    codec = get_codec(path)
+    if codec is None:
+        return path
+    return path[:-len(CODECS[codec])]
+
+
+def _open_binary(path, mode, codec, level):
+    if codec == 'gzip':
+        if level is None:
+            return gzip.open(path, mode)
+        return gzip.open(path, mode, compresslevel=level)
+
+    if codec == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise CompressionError("zstd compression needs `zstandard`")
+        if 'w' in mode:
+            cctx = zstandard.ZstdCompressor(level=3 if level is None else level)
+            return zstandard.open(path, mode, cctx=cctx)
+        return zstandard.open(path, mode)
+
+    if codec == 'lz4':
+        try:
+            import lz4.frame
+        except ImportError:
+            raise CompressionError("lz4 compression needs `lz4`")
+        if 'w' in mode and level is not None:
+            return lz4.frame.open(path, mode, compression_level=level)
+        return lz4.frame.open(path, mode)
+
+    raise CompressionError("Unknown compression codec: {}".format(codec))
+
+
+class ThreadedWriter(object):
+    """Binary or text writer compressing data in a dedicated thread.
+
+    Data is accumulated in blocks that are handed over to the compression
+    thread through a bounded queue, so compression overlaps with whatever the
+    calling thread does (e.g. fetching the next points from the server).
+    """
+    def __init__(self, fd, blocksize=BLOCKSIZE):
+        self._fd = fd
+        self._blocksize = blocksize
+        self._buffer = []
+        self._size = 0
+        self._blocks = queue.Queue(maxsize=4)
+        self._errors = []
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            block = self._blocks.get()
+            if block is None:
+                return
+            if self._errors:
+                continue
+            try:
+                self._fd.write(block)
+            except BaseException as e:
+                self._errors.append(e)
+
+    def _check(self):
+        if self._errors:
+            raise self._errors[0]
+
+    def _flush(self):
+        if self._buffer:
+            self._blocks.put(b''.join(self._buffer))
+            self._buffer = []
+            self._size = 0
+        self._check()
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self._buffer.append(data)
+        self._size += len(data)
+        if self._size >= self._blocksize:
+            self._flush()
+        return len(data)
+
+    def close(self):
+        try:
+            self._flush()
+        finally:
+            self._blocks.put(None)
+            self._thread.join()
+            self._fd.close()
+        self._check()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def open_file(path, mode='r', codec=None, level=None, fileobj=None):
+    """Open a possibly compressed file, in text mode unless `mode` is a binary
+    mode. Text is always encoded in UTF-8, whatever the locale.
+
+    When reading, the codec is guessed from the file name. When writing with
+    a codec, compression runs in its own thread and the returned object only
+    supports `write` and `close`. When given, `fileobj` is a binary file
+    object of `path` written to instead of opening `path`.
+    """
+    if 'r' in mode:
+        codec = get_codec(path)
+        if codec is None:
+            if 'b' in mode:
+                return open(path, mode)
+            return open(path, mode, encoding='utf-8')
+        fd = _open_binary(path, 'rb', codec, None)
+        if 'b' in mode:
+            return fd
+        return io.TextIOWrapper(fd, encoding='utf-8')
+
+    if codec is None:
+        if fileobj is None:
+            if 'b' in mode:
+                return open(path, mode)
+            return open(path, mode, encoding='utf-8')
+        if 'b' in mode:
+            return fileobj
+        return io.TextIOWrapper(fileobj, encoding='utf-8')
+    if fileobj is not None:
+        path = fileobj
+    return ThreadedWriter(_open_binary(path, 'wb', codec, level))
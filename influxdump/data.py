@@ -3,14 +3,43 @@ from datetime import datetime
 import json
 import os
 import os.path
+import queue
 import re
 import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
 
 import influxdb
 from requests.exceptions import RequestException
 
-from .db import get_queries, data_to_points
-from .exceptions import TypecastError
+from .db import (
+    get_queries,
+    data_to_points,
+    get_windows,
+    parse_time,
+)
+from .catalogue import (
+    Catalogue,
+    ChecksumWriter,
+    get_window,
+    in_window,
+)
+from .columnar import (
+    cast_columns,
+    iter_records,
+    read_columns,
+    read_header,
+    write_columns,
+)
+from .compression import CODECS, open_file, strip_codec
+from .exceptions import ManifestError, RecastError, TypecastError
+from .journal import JOURNAL, Journal
+from .lineprotocol import encode_records, get_series_key, rfc3339_to_ns
+from .manifest import GENERATION, Manifest, list_generations
+from .sizing import MEMORY_BUDGET, TARGET_LATENCY, Sizer, record_size
+from .stream import read_documents, write_document
 
 
 FIELDTYPES = {
@@ -20,6 +49,26 @@ FIELDTYPES = {
     'boolean': 'bool',
 }
 
+FORMATS = {
+    'json': '.json',
+    'lp': '.lp',
+    'col': '.col',
+}
+
+META = '.meta'
+
+BATCHSIZE = 10000
+
+PROBES = ('count', 'limit', 'batch', 'cardinality')
+
+# number of statements per multi-statement probe query
+PROBE_SIZE = 100
+
+# number of statements per multi-statement query of small queries
+SMALL_BATCH = 50
+
+_stdout_lock = threading.Lock()
+
 
 def has_data(client, query):
     """Test if a query covers any data.
@@ -36,65 +85,272 @@ def has_data(client, query):
     return True
 
 
+def has_points(client, query):
+    """Test if a query covers any data by fetching a single point, which
+    unlike `has_data` does not scan the whole time range.
+    """
+    res = client.query(query.get_query() + " LIMIT 1")
+    if len(res.items()) == 0:
+        return False
+    return True
+
+
+class DataProbe(object):
+    """Test whether queries cover any data, results are cached.
+
+    Strategies are:
+
+    - `count`: a `COUNT(*)` query per query (see `has_data`), a full scan
+    - `limit`: a `LIMIT 1` query per query (see `has_points`)
+    - `batch`: `LIMIT 1` queries sent `PROBE_SIZE` at a time in
+      multi-statement queries
+    - `cardinality`: a single `SHOW SERIES EXACT CARDINALITY` query, a
+      measurement with series is considered to have data. Series are not
+      bound to a time range, queries with a time range are probed with
+      `LIMIT 1`
+    """
+    def __init__(self, strategy='count'):
+        if strategy not in PROBES:
+            raise ValueError("Unknown probe strategy: {}".format(strategy))
+        self.strategy = strategy
+        self.results = {}
+
+    def prepare(self, c, queries):
+        """Probe queries in bulk, for strategies supporting it, queries with a
+        known result are skipped.
+        """
+        queries = [q for q in queries if q.get_query() not in self.results]
+        if self.strategy == 'batch':
+            for i in range(0, len(queries), PROBE_SIZE):
+                batch = queries[i:i + PROBE_SIZE]
+                res = c.query(";".join(q.get_query() + " LIMIT 1"
+                    for q in batch))
+                # a single statement is not answered with a list
+                if type(res) == influxdb.resultset.ResultSet:
+                    res = [res]
+                for (q, r) in zip(batch, res):
+                    self.results[q.get_query()] = len(r.items()) > 0
+        elif self.strategy == 'cardinality':
+            res = c.query("SHOW SERIES EXACT CARDINALITY")
+            measurements = set()
+            for ((measurement, _), points) in res.items():
+                if any(p.get("count") for p in points):
+                    measurements.add(measurement)
+            for q in queries:
+                if q.ctx.get("start", '') == '' and q.ctx.get("end", '') == '':
+                    self.results[q.get_query()] = q.measurement in measurements
+
+    def record(self, query, count):
+        """Record the number of points of a query counted beforehand (e.g. to
+        shard it), the query is not probed again.
+        """
+        self.results[query.get_query()] = count > 0
+
+    def has_data(self, c, query):
+        key = query.get_query()
+        if key not in self.results:
+            if self.strategy == 'count':
+                self.results[key] = has_data(c, query)
+            else:
+                self.results[key] = has_points(c, query)
+        return self.results[key]
+
+
+def count_data(client, query):
+    """Count points covered by a query, the count of the most populated field
+    is used as the number of points.
+    """
+    res = client.query(query.get_count())
+    counts = [0]
+    for point in client.get_points(res):
+        for (k, v) in point.items():
+            if k != "time" and v is not None:
+                counts.append(v)
+    return max(counts)
+
+
+def get_time_bounds(client, query):
+    """Return timestamps of the first and last points covered by a query,
+    `(None, None)` if the query does not cover any data.
+    """
+    bounds = []
+    for suffix in (" LIMIT 1", " ORDER BY time DESC LIMIT 1"):
+        res = client.query(query.get_query() + suffix)
+        points = list(client.get_points(res))
+        if not points:
+            return (None, None)
+        bounds.append(parse_time(points[0]["time"]))
+
+    return tuple(bounds)
+
+
+def shard_query(client, query, width=None, shard_size=None, probe=None):
+    """Split a query in time windows that can be dumped independently.
+
+    Windows either have a fixed `width`, or are sized from the number of
+    points covered by the query so that each window holds about `shard_size`
+    points. Open query boundaries are resolved with the first/last points of
+    the measurement.
+
+    :param width: fixed width of time windows
+    :type width: timedelta
+    :param shard_size: targeted number of points per window
+    :type shard_size: int
+    :param probe: probe recording the number of points counted with
+        `shard_size`, so that an unsharded query is not counted again
+    :type probe: DataProbe
+    """
+    if shard_size is not None:
+        count = count_data(client, query)
+        if probe is not None:
+            probe.record(query, count)
+        if count <= shard_size:
+            return [query]
+
+    start = query.ctx.get("start", "")
+    end = query.ctx.get("end", "")
+    if start == "" or end == "":
+        (first, last) = get_time_bounds(client, query)
+        if first is None:
+            return [query]
+    if start != "":
+        first = parse_time(start)
+    if end != "":
+        last = parse_time(end)
+
+    if shard_size is not None:
+        width = (last - first) * shard_size / count
+    if width.total_seconds() <= 0:
+        return [query]
+
+    windows = get_windows(first, last, width, start, end)
+    if len(windows) == 1:
+        return [query]
+    return query.shard(windows)
+
+
+class RecordStats(object):
+    """Iterable wrapper over records keeping their count and the time of the
+    first and last records once iterated.
+    """
+    def __init__(self, records):
+        self._records = records
+        self.count = 0
+        self.first = None
+        self.last = None
+        # memory used by the first record
+        self.size = 0
+
+    def __iter__(self):
+        for record in self._records:
+            if self.first is None:
+                self.first = record["time"]
+                self.size = record_size(record)
+            self.last = record["time"]
+            self.count += 1
+            yield record
+
+
 def query_data(
         c,
         queries,
         chunk_size,
         typecast=False,
         cast={},
-        retry=0
+        retry=0,
+        probe=None,
+        sizer=None
     ):
     """Generator querying the db and sending back data for each query as
-    elements.
+    elements. Records of each element are a `RecordStats` over a generator of
+    points.
+
+    With a `sizer` (see `influxdump.sizing.Sizer`), the chunk size of each
+    query is adapted to the time taken and the memory used by the previous
+    chunks of the same measurement. A query is restarted from the time of its
+    last record with the new size when the sizer asks for it, as for retries.
+
+    Queries without data, as tested by `probe` (a `DataProbe`, `count` by
+    default), only send back their meta.
+
+    When a query fails and is retried, it restarts from the time of the last
+    record handed out (duplicate points at that time are harmless as writes
+    are idempotent) and chunk numbering goes on.
     """
+    if probe is None:
+        probe = DataProbe()
+
     _r = 0
     for q in queries:
-        if has_data(c, q) is False:
+        if probe.has_data(c, q) is False:
             meta = get_meta(c, q, typecast, cast)
             yield (None, {
                 "meta": meta,
             })
             continue
 
+        query = q
+        counter = 0
+        last = None
         while True:
-            res = c.query(q.get_query(),
-                    chunked=True,
-                    chunk_size=chunk_size)
-            counter = 0
             try:
+                size = chunk_size
+                if sizer is not None:
+                    size = sizer.get_size(q.measurement)
+                start = time.monotonic()
+                res = c.query(query.get_query(),
+                        chunked=True,
+                        chunk_size=size)
                 meta = get_meta(c, q, typecast, cast)
                 # sometimes answers are not chunked...
                 if type(res) == influxdb.resultset.ResultSet:
-                    records = []
-                    counter += 1
-                    for point in c.get_points(res):
-                        records.append(point)
+                    res = [res]
 
+                # records are streamed to the consumer, they have to be
+                # consumed before asking for the next chunk
+                resized = False
+                for r in res:
+                    elapsed = time.monotonic() - start
+                    counter += 1
+                    records = RecordStats(c.get_points(r))
                     yield (counter, {
                         "meta": meta,
-                        "records": records
+                        "records": records,
                     })
-                else:
-                    for r in res:
-                        records = []
-                        counter += 1
-                        for point in c.get_points(r):
-                            records.append(point)
-
-                        yield (counter, {
-                            "meta": meta,
-                            "records": records
-                        })
-                break
+                    if records.last is not None:
+                        last = records.last
+                    if sizer is not None:
+                        sizer.observe(q.measurement, records.count, elapsed,
+                                records.size)
+                        # a partial chunk ends the stream
+                        resized = records.count == size \
+                                and sizer.resize(q.measurement, size) \
+                                is not None
+                        if resized is True:
+                            break
+                    start = time.monotonic()
+                if resized is False:
+                    break
+                if hasattr(res, "close"):
+                    # release the connection of the abandoned stream
+                    res.close()
+                query = q.resume(last)
             except RequestException:
                 if retry == 0:
                     raise
                 _r += 1
                 if _r > retry:
                     raise
+                if last is None:
+                    counter = 0
+                else:
+                    query = q.resume(last)
 
 
-def get_meta(c, q, typecast=False, cast={}):
+def get_meta(c, q, typecast=False, cast={}, tags=True):
+    """Return the metadata of a query, with the field types when `typecast`
+    is enabled and the tag keys of the measurement when `tags` is enabled.
+    """
     meta = q.get_meta()
 
     if typecast is True:
@@ -102,16 +358,459 @@ def get_meta(c, q, typecast=False, cast={}):
             meta['types'] = cast
         else:
             _cast = {}
-            res = c.query(q.get_meta_query())
-            for p in res.get_points():
-                if 'fieldType' not in p:
+            for (key, _type) in c.schema.get_fields(c, q).items():
+                if _type is None:
                     raise TypecastError("Field type cannot be guessed")
-                _cast[p['fieldKey']] = FIELDTYPES[p['fieldType']]
+                _cast[key] = FIELDTYPES[_type]
             meta['types'] = _cast
 
+    if tags is True and c.has_tags is True:
+        meta['tags'] = list(c.schema.get_tags(c, q))
+
     return meta
 
 
+def get_format(path):
+    """Return the format of a chunk file from its name, None if the file is
+    not a chunk file.
+    """
+    name = strip_codec(path)
+    for (fmt, suffix) in FORMATS.items():
+        if name.endswith(suffix):
+            return fmt
+    return None
+
+
+def get_sidecar(datafile):
+    """Return the path of the metadata sidecar of a chunk file"""
+    name = strip_codec(datafile)
+    return name[:-len(FORMATS[get_format(datafile)])] + META
+
+
+def read_sidecar(datafile):
+    """Read the metadata sidecar of a chunk file, None if it has none.
+
+    Line protocol chunks always have one, json and columnar chunks only once
+    recast, their sidecar then supersedes the metadata of the file.
+    """
+    if get_format(datafile) is None:
+        # not a chunk file, e.g. a dump from stdout
+        return None
+    try:
+        with open(get_sidecar(datafile), 'r') as fd:
+            return json.load(fd)
+    except FileNotFoundError:
+        if get_format(datafile) == 'lp':
+            raise
+        return None
+
+
+def read_meta(datafile):
+    """Read the metadata of a chunk file without reading its records"""
+    meta = read_sidecar(datafile)
+    if meta is not None:
+        return meta
+    if get_format(datafile) == 'col':
+        with open_file(datafile, 'rb') as fd:
+            return read_header(fd)["meta"]
+    with open_file(datafile, 'r') as fd:
+        for (meta, _) in read_documents(fd):
+            return meta
+
+
+def write_meta(datafile, meta):
+    """Replace the metadata of a chunk file by writing its sidecar, records
+    are never rewritten. The sidecar is written to a temporary file renamed
+    over the previous one, an interrupted write leaves it untouched.
+
+    Values of json chunks are cast with the sidecar types when loaded with
+    typecasting and columns of columnar chunks whose type changed are always
+    cast. Line protocol chunks cannot be recast: their values are encoded in
+    the lines with the types of their sidecar, which must be kept.
+
+    :raises RecastError: for line protocol chunks whose types change
+    """
+    if get_format(datafile) == 'lp' \
+            and read_meta(datafile).get("types") != meta.get("types"):
+        raise RecastError(
+            "Line protocol chunk {} cannot be recast, its values are encoded "
+            "with the types they were dumped with".format(datafile))
+
+    sidecar = get_sidecar(datafile)
+    tmp = sidecar + ".tmp"
+    with open(tmp, 'w') as fd:
+        json.dump(meta, fd)
+    os.replace(tmp, sidecar)
+
+
+def get_fragment(meta, counter):
+    """Return the base name (without extension) of a chunk file"""
+    if "shard" in meta["context"]:
+        return "{}-{:05d}-{:05d}".format(
+                meta["measurement"],
+                meta["context"]["shard"],
+                counter)
+    return "{}-{:05d}".format(meta["measurement"], counter)
+
+
+def write_lines(fd, lines):
+    """Write lines on a text file object, return the number of lines"""
+    count = 0
+    for line in lines:
+        fd.write(line)
+        fd.write('\n')
+        count += 1
+    return count
+
+
+def write_chunk(counter, data, folder=None, verbose=False, fmt='json',
+        compress=None, compress_level=None):
+    """Write a chunk produced by `query_data`, either on stdout or as a
+    fragment file in `folder`. Records are serialized as they are read so the
+    chunk is never held in memory.
+
+    With the `lp` format, records are written in line protocol and the chunk
+    metadata is written in a `.meta` sidecar file. The `col` format (columnar
+    binary, see `influxdump.columnar`) can only be written in a folder.
+
+    :param fmt: output format, `json`, `lp` or `col`
+    :type fmt: str
+    :param compress: compression codec of fragment files, see
+        `influxdump.compression.CODECS`
+    :type compress: str
+    :param compress_level: compression level, codec default if None
+    :type compress_level: int
+    The size and checksum of a fragment file are computed while it is
+    written and kept in the `info` entry of `data`.
+
+    :returns: the path of the fragment file, None on stdout
+    """
+    meta = data["meta"]
+    if fmt == 'lp':
+        records = encode_records(meta["measurement"], data["records"],
+                meta.get("types", {}), meta.get("tags", ()))
+    else:
+        records = data["records"]
+
+    if folder is None:
+        if verbose is True:
+            sys.stdout.write("> dumping {}\n".format(meta["measurement"]))
+        # chunks from concurrent workers must not be interleaved on stdout
+        with _stdout_lock:
+            if fmt == 'lp':
+                write_lines(sys.stdout, records)
+            else:
+                write_document(sys.stdout, meta, records)
+                sys.stdout.write("\n")
+    else:
+        bundle = os.path.join(folder, meta["measurement"])
+        os.makedirs(bundle, exist_ok=True)
+
+        fragment = os.path.join(bundle, get_fragment(meta, counter))
+        dumpfile = fragment + FORMATS[fmt]
+        if compress is not None:
+            dumpfile += CODECS[compress]
+        meta["chunk_count"] = counter
+
+        with ChecksumWriter(dumpfile) as raw:
+            if fmt == 'col':
+                with open_file(dumpfile, "wb", compress, compress_level,
+                        raw) as fd:
+                    count = write_columns(fd, meta, records)
+            else:
+                with open_file(dumpfile, "w", compress, compress_level,
+                        raw) as fd:
+                    if fmt == 'lp':
+                        count = write_lines(fd, records)
+                    else:
+                        count = write_document(fd, meta, records)
+        data["info"] = raw.describe()
+
+        if fmt == 'lp':
+            with open(fragment + META, "w") as fd:
+                json.dump(meta, fd)
+
+        if verbose is True:
+            sys.stdout.write(
+                "> dumped {} (chunk {:05d}) to {} ({} records) [{}]\n".format(
+                meta["measurement"], counter, dumpfile,
+                count, datetime.now().isoformat()))
+
+        return dumpfile
+
+
+def commit_chunk(manifest, query, counter, dumpfile, folder, data):
+    """Record a chunk written by `write_chunk` in the manifest, with what the
+    catalogue of the folder lists about it.
+    """
+    records = data["records"]
+    manifest.add_chunk(query, counter, os.path.relpath(dumpfile, folder),
+            records.count, records.first, records.last,
+            dict(data["meta"]), data["info"])
+
+
+def write_catalogue(folder, manifest):
+    """Write the catalogue of a dump folder from the chunks committed in its
+    manifest, chunks of older manifests are described from their files.
+    """
+    catalogue = Catalogue(folder)
+    for (measurement, chunk) in manifest.get_chunks():
+        datafile = os.path.join(folder, chunk["file"])
+        meta = chunk["meta"]
+        if meta is None:
+            meta = read_meta(datafile)
+        catalogue.add(datafile, meta, chunk["records"], chunk["first"],
+                chunk["last"], chunk["info"])
+    catalogue.save()
+    return catalogue
+
+
+def dump_query(
+        c,
+        query,
+        folder=None,
+        chunk_size=50000,
+        retry=0,
+        typecast=False,
+        cast={},
+        verbose=False,
+        fmt='json',
+        compress=None,
+        compress_level=None,
+        manifest=None,
+        probe=None,
+        sizer=None
+    ):
+    """Dump all chunks of a single query.
+
+    When a manifest is given, committed chunks are recorded in it. Queries
+    already completed in the manifest are skipped, partially dumped ones
+    restart from the time of their last committed record.
+    """
+    offset = 0
+    if manifest is not None:
+        entry = manifest.get(query)
+        if entry is not None and entry["complete"] is True:
+            if verbose is True:
+                sys.stdout.write("> Skipping completed {}\n".format(
+                    query.measurement))
+            return
+
+        (offset, last) = manifest.get_last(query)
+        if last is not None:
+            if verbose is True:
+                sys.stdout.write("> Resuming {} from {}\n".format(
+                    query.measurement, last))
+            query = query.resume(last)
+
+    for (counter, data) in query_data(
+            c,
+            [query],
+            chunk_size,
+            typecast,
+            cast,
+            retry,
+            probe,
+            sizer,
+        ):
+        if counter is None:
+            if verbose is True:
+                sys.stdout.write("> Skipping empty dataset {}\n".format(
+                    data["meta"]["measurement"]))
+            continue
+
+        dumpfile = write_chunk(counter + offset, data, folder, verbose, fmt,
+                compress, compress_level)
+        if manifest is not None:
+            commit_chunk(manifest, query, counter + offset, dumpfile, folder,
+                    data)
+
+    if manifest is not None:
+        manifest.complete(query)
+
+
+def dump_batch(
+        c,
+        queries,
+        folder=None,
+        chunk_size=50000,
+        retry=0,
+        typecast=False,
+        cast={},
+        verbose=False,
+        fmt='json',
+        compress=None,
+        compress_level=None,
+        manifest=None,
+        probe=None,
+        sizer=None,
+        limit=1000
+    ):
+    """Dump small queries with a single multi-statement query, each
+    statement returning at most `limit` + 1 points. Queries having more than
+    `limit` points are left out, to be dumped with `dump_query`.
+
+    When the query fails and `retry` is enabled, no query is dumped so that
+    they all go through `dump_query` and its retries.
+
+    :returns: the list of dumped queries
+    """
+    suffix = " LIMIT {}".format(limit + 1)
+    try:
+        res = c.query(";".join(q.get_query() + suffix for q in queries))
+    except RequestException:
+        if retry == 0:
+            raise
+        return []
+    # a single statement is not answered with a list
+    if type(res) == influxdb.resultset.ResultSet:
+        res = [res]
+
+    dumped = []
+    for (q, r) in zip(queries, res):
+        points = list(c.get_points(r))
+        if len(points) > limit:
+            continue
+
+        if points:
+            data = {
+                "meta": get_meta(c, q, typecast, cast),
+                "records": RecordStats(points),
+            }
+            dumpfile = write_chunk(1, data, folder, verbose, fmt, compress,
+                    compress_level)
+            if manifest is not None:
+                commit_chunk(manifest, q, 1, dumpfile, folder, data)
+        elif verbose is True:
+            sys.stdout.write("> Skipping empty dataset {}\n".format(
+                q.measurement))
+
+        if manifest is not None:
+            manifest.complete(q)
+        dumped.append(q)
+
+    return dumped
+
+
+def dump_batches(c, queries, small, jobs=1, **kwargs):
+    """Dump queries of at most `small` points by batches of `SMALL_BATCH`
+    statements, see `dump_batch`.
+
+    :returns: the list of dumped queries
+    """
+    limit = min(small, kwargs.get("chunk_size", small))
+    groups = [queries[i:i + SMALL_BATCH]
+            for i in range(0, len(queries), SMALL_BATCH)]
+    if jobs > 1:
+        results = run_parallel(c, dump_batch, groups, jobs, limit=limit,
+                **kwargs)
+    else:
+        results = [dump_batch(c, group, limit=limit, **kwargs)
+                for group in groups]
+    return [q for dumped in results for q in dumped]
+
+
+def run_parallel(c, func, items, jobs, **kwargs):
+    """Call `func(client, item, **kwargs)` for each item with a pool of `jobs`
+    threads, return results in the order of `items`.
+
+    Each worker thread uses its own client, cloned from `c`.
+    """
+    local = threading.local()
+
+    def worker(item):
+        if not hasattr(local, "client"):
+            local.client = c.clone()
+        return func(local.client, item, **kwargs)
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(worker, item) for item in items]
+        try:
+            return [future.result() for future in futures]
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+
+def run_processes(func, items, jobs, **kwargs):
+    """Call `func(item, **kwargs)` for each item with a pool of `jobs`
+    processes, or in the current process when `jobs` is 1, return results in
+    the order of `items`. `func`, items and arguments must be picklable.
+    """
+    if jobs <= 1:
+        return [func(item, **kwargs) for item in items]
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(func, item, **kwargs) for item in items]
+        try:
+            return [future.result() for future in futures]
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+
+def plan_queries(c, queries, jobs=1, width=None, shard_size=None,
+        verbose=False, probe=None):
+    """Shard queries in time windows, see `shard_query`"""
+    kwargs = {"width": width, "shard_size": shard_size, "probe": probe}
+    if jobs > 1:
+        plans = run_parallel(c, shard_query, queries, jobs, **kwargs)
+    else:
+        plans = [shard_query(c, q, **kwargs) for q in queries]
+
+    sharded = []
+    for (q, plan) in zip(queries, plans):
+        if verbose is True and len(plan) > 1:
+            sys.stdout.write("> {} split in {} time windows\n".format(
+                q.measurement, len(plan)))
+        sharded.extend(plan)
+
+    return sharded
+
+
+def prepare_generation(folder, resume=False):
+    """Prepare a new generation of an incremental dump in `folder`, or the
+    last one when resuming.
+
+    :returns: a `(generation folder, newest)` tuple, `newest` being the time
+        of the newest record of each measurement in previous generations
+    """
+    generations = list_generations(folder)
+    if resume is True and generations:
+        current = generations[-1]
+        generations = generations[:-1]
+    else:
+        current = os.path.join(folder, GENERATION.format(len(generations)))
+
+    newest = {}
+    for path in generations:
+        manifest = Manifest(path).load()
+        if not manifest.is_complete():
+            raise ManifestError(
+                "Generation {} is incomplete, resume it first".format(path))
+        for (m, last) in manifest.get_newest().items():
+            if m not in newest \
+                    or rfc3339_to_ns(last) > rfc3339_to_ns(newest[m]):
+                newest[m] = last
+
+    return (current, newest)
+
+
+def get_increments(queries, newest):
+    """Restrict queries to points newer than the newest dumped ones"""
+    increments = []
+    for q in queries:
+        last = newest.get(q.measurement)
+        start = q.ctx.get("start", "")
+        if last is not None \
+                and (start == "" or rfc3339_to_ns(last) >= rfc3339_to_ns(start)):
+            q = q.resume(last, exclusive=True)
+        increments.append(q)
+    return increments
+
+
 def dump_data(
         c,
         pattern=None,
@@ -123,106 +822,479 @@ def dump_data(
         retry=0,
         typecast=False,
         cast={},
-        verbose=False
+        verbose=False,
+        jobs=1,
+        shard_width=None,
+        shard_size=None,
+        fmt='json',
+        compress=None,
+        compress_level=None,
+        resume=False,
+        incremental=False,
+        probe='count',
+        batch_small=None,
+        adaptive=False,
+        target_latency=TARGET_LATENCY,
+        memory_budget=MEMORY_BUDGET
     ):
     """Get data from the database, return an `influxdb.ResultSet`
 
+    A dump in a folder ends with the writing of its catalogue, listing its
+    chunk files (see `influxdump.catalogue`).
+
     :param c: an influxdb client instance
     :type c: InfluxDBClient
+    :param jobs: number of queries dumped concurrently
+    :type jobs: int
+    :param shard_width: split queries in time windows of fixed width
+    :type shard_width: timedelta
+    :param shard_size: split queries in time windows of about `shard_size`
+        points
+    :type shard_size: int
+    :param fmt: output format, `json`, `lp` (line protocol) or `col`
+        (columnar). Field types are always discovered with `lp` and `col` so
+        that values are written with the right type
+    :type fmt: str
+    :param compress: compression codec of fragment files, see
+        `influxdump.compression.CODECS`. Compression runs in its own thread,
+        overlapping with queries
+    :type compress: str
+    :param compress_level: compression level, codec default if None
+    :type compress_level: int
+    :param resume: resume an interrupted dump from the manifest of `folder`,
+        the queries planned by the interrupted dump are used
+    :type resume: bool
+    :param incremental: dump in a new generation folder of `folder` only the
+        points newer than the ones dumped in previous generations
+    :type incremental: bool
+    :param probe: strategy used to skip queries without data, see
+        `DataProbe`
+    :type probe: str
+    :param batch_small: dump queries of at most `batch_small` points with
+        multi-statement queries, larger ones are dumped one by one
+    :type batch_small: int
+    :param adaptive: adapt the chunk size of each query, starting from
+        `chunk_size`, so that chunks take about `target_latency` seconds and
+        hold at most `memory_budget` bytes. A query is restarted from its
+        last record when its chunk size changes, the points at that time are
+        dumped twice
+    :type adaptive: bool
+    :param target_latency: target duration of a chunk in seconds
+    :type target_latency: float
+    :param memory_budget: maximum memory held by a chunk in bytes
+    :type memory_budget: int
     """
-    measurements = c.get_measurements(pattern)
-    if verbose is True or dryrun is True:
-        sys.stdout.write("> {} measurements matched\n".format(
-            len(measurements)))
-    queries = get_queries(measurements, start=start, end=end)
+    if fmt in ('lp', 'col'):
+        typecast = True
 
-    if dryrun is True:
-        sys.stdout.write("> following measurements would be dumped:\n".format(
-                len(measurements)))
-        for m in measurements:
-            sys.stdout.write("    {}\n".format(m))
+    newest = {}
+    if incremental is True and dryrun is False:
+        (folder, newest) = prepare_generation(folder, resume)
+        if verbose is True:
+            sys.stdout.write("> incremental dump in {}\n".format(folder))
+
+    manifest = None
+    if folder is not None and dryrun is False:
+        manifest = Manifest(folder)
+        if resume is True:
+            manifest.load()
+
+    probe = DataProbe(probe)
+    if manifest is not None and manifest.plan is not None:
+        queries = manifest.get_queries()
+        if verbose is True:
+            sys.stdout.write("> resuming dump of {} queries\n".format(
+                len(queries)))
     else:
-        for (counter, data) in query_data(
-                c,
-                queries,
-                chunk_size,
-                typecast,
-                cast,
-                retry,
-            ):
-            if counter is None:
-                if verbose is True:
-                    sys.stdout.write("> Skipping empty dataset {}\n".format(
-                        data["meta"]["measurement"]))
-                continue
+        measurements = c.get_measurements(pattern)
+        if verbose is True or dryrun is True:
+            sys.stdout.write("> {} measurements matched\n".format(
+                len(measurements)))
+        queries = get_queries(measurements, start=start, end=end)
+        if newest:
+            queries = get_increments(queries, newest)
+
+        if dryrun is True:
+            sys.stdout.write(
+                "> following measurements would be dumped:\n".format(
+                    len(measurements)))
+            for m in measurements:
+                sys.stdout.write("    {}\n".format(m))
+            return
+
+        if shard_width is not None or shard_size is not None:
+            queries = plan_queries(c, queries, jobs, shard_width, shard_size,
+                    verbose, probe)
+
+    pending = []
+    for q in queries:
+        entry = manifest.get(q) if manifest is not None else None
+        if entry is None or entry["complete"] is False:
+            pending.append(q)
+
+    if c.has_tags is True:
+        # one bulk schema discovery instead of one per measurement
+        c.schema.discover(c, sorted(set(q.measurement for q in pending)),
+                fields=typecast is True and cast == {})
+
+    sizer = None
+    if adaptive is True:
+        sizer = Sizer(chunk_size, target_latency, memory_budget)
+
+    kwargs = {
+        "folder": folder,
+        "chunk_size": chunk_size,
+        "retry": retry,
+        "typecast": typecast,
+        "cast": cast,
+        "verbose": verbose,
+        "fmt": fmt,
+        "compress": compress,
+        "compress_level": compress_level,
+        "manifest": manifest,
+        "probe": probe,
+        "sizer": sizer,
+    }
+    if manifest is not None:
+        # the catalogue of a previous run would not list the chunks written
+        # from now on, it is written again once the dump is complete
+        Catalogue(folder).remove()
+        manifest.open(resume)
+        if manifest.plan is None:
+            manifest.set_plan(queries)
+
+    try:
+        if batch_small is not None:
+            # queries without any chunk yet
+            fresh = [q for q in pending
+                    if manifest is None or manifest.get(q) is None]
+            dumped = dump_batches(c, fresh, batch_small, jobs, **kwargs)
+            queries = [q for q in queries if q not in dumped]
+            pending = [q for q in pending if q not in dumped]
+            if verbose is True:
+                sys.stdout.write("> {} small queries dumped by batches\n"
+                        .format(len(dumped)))
+
+        probe.prepare(c, pending)
+        if jobs > 1:
+            run_parallel(c, dump_query, queries, jobs, **kwargs)
+        else:
+            for q in queries:
+                dump_query(c, q, **kwargs)
+    finally:
+        if manifest is not None:
+            manifest.close()
+
+    if manifest is not None:
+        write_catalogue(folder, manifest)
+
+
+def iter_batches(iterable, size):
+    """Split an iterable in lists of at most `size` elements"""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
 
-            if folder is None:
-                if verbose is True:
-                    sys.stdout.write("> dumping {}\n".format(
-                        data["meta"]["measurement"]))
-                print(json.dumps(data))
-            else:
-                bundle = os.path.join(folder,
-                        data["meta"]["measurement"])
-                if not os.path.exists(bundle):
-                    os.makedirs(bundle)
 
-                fragment = "{}-{:05d}.json".format(
-                        data["meta"]["measurement"],
-                        counter)
-                dumpfile = os.path.join(bundle, fragment)
-                data["meta"]["chunk_count"] = counter
+def iter_points(measurement, records, typecast=False, cast={},
+        batch_size=BATCHSIZE, protocol='json', tags=()):
+    """Generator of batches of points built from records, records are
+    consumed lazily by batches of `batch_size`.
 
-                if verbose is True:
-                    sys.stdout.write(
-                        "> dumping {} (chunk {:05d}) to {} ({} records) [{}]\n".format(
-                        data["meta"]["measurement"], counter, dumpfile,
-                        len(data["records"]), datetime.now().isoformat()))
+    With the `json` protocol points are dicts, with the `line` protocol they
+    are line protocol strings with nanosecond timestamps. Columns listed in
+    `tags` are written as tags and the points of a batch are sorted by series,
+    which the server ingests faster.
+    """
+    tags = sorted(tags)
+    for batch in iter_batches(records, batch_size):
+        if tags:
+            batch.sort(key=lambda r: get_series_key(r, tags))
+        if protocol == 'line':
+            points = list(encode_records(measurement, batch, cast, tags))
+        else:
+            points = data_to_points(measurement, batch, typecast, cast, tags)
+        if points:
+            yield points
+
+
+def get_write_options(protocol='json'):
+    """Options of `write_points` for batches built with `protocol`"""
+    if protocol == 'line':
+        return {"protocol": "line", "time_precision": "n"}
+    return {}
+
+
+def write_data(c, data, typecast=False, cast={}, protocol='json'):
+    for points in iter_points(data["meta"]["measurement"], data["records"],
+            typecast, cast, protocol=protocol,
+            tags=data["meta"].get("tags", ())):
+        c.write_points(points, **get_write_options(protocol))
+
+
+def read_lines(fh):
+    """Generator of the line protocol lines of a file"""
+    for line in fh:
+        line = line.rstrip('\n')
+        if line and not line.startswith('#'):
+            yield line
+
+
+def filter_records(records, window):
+    """Generator of the records in the nanosecond range `window`"""
+    for record in records:
+        if in_window(rfc3339_to_ns(record["time"]), window):
+            yield record
 
-                with open(dumpfile, "w") as fd:
-                    json.dump(data, fd)
+
+def filter_lines(lines, window):
+    """Generator of the line protocol lines in the nanosecond range
+    `window`, lines have nanosecond timestamps.
+    """
+    for line in lines:
+        if in_window(int(line.rsplit(' ', 1)[1]), window):
+            yield line
 
 
-def write_data(c, data, typecast=False, cast={}):
-    points = data_to_points(data["meta"]["measurement"],
-                            data["records"],
-                            typecast,
-                            cast)
-    c.write_points(points, batch_size=10000)
+def read_file(datafile, typecast=False, cast={}, verbose=False,
+        batch_size=BATCHSIZE, protocol='json', window=None):
+    """Generator of `(points, options)` batches read from a dump file, where
+    `options` are the `write_points` options for the batch.
 
+    Json files are either chunk files or dumps on stdout holding one chunk per
+    line, records are parsed incrementally so batches are available before
+    the file is read to the end. Line protocol files are sent as is with the
+    line protocol whatever `protocol` is, values are already typed. Columnar
+    files are cast column by column.
 
-def load_file(c, datafile, typecast=False, cast={}, verbose=False):
-    with open(datafile, 'r') as fh:
-        data = json.load(fh)
+    :param window: only read records in this `(start, end)` nanosecond range,
+        see `influxdump.catalogue.get_window`
+    :type window: tuple
+    """
+    if get_format(datafile) == 'col':
+        with open_file(datafile, 'rb') as fh:
+            (meta, times, columns) = read_columns(fh)
+
+        # columns were typed with the types of the dump
+        recast = {}
+        override = read_sidecar(datafile)
+        if override is not None:
+            types = meta.get("types", {})
+            recast = dict((k, v) for (k, v) in override["types"].items()
+                    if types.get(k) != v)
+            meta = override
 
         if verbose is True:
             sys.stdout.write(
                 "> loading {} in {} ({} records) [{}]\n".format(
-                datafile, data["meta"]["measurement"],
-                len(data["records"]), datetime.now().isoformat()))
+                datafile, meta["measurement"], len(times),
+                datetime.now().isoformat()))
 
-        if typecast is True \
-                and cast == {} \
-                and "types" in data["meta"]:
-            cast = data["meta"]["types"]
+        tags = meta.get("tags", ())
+        if typecast is True and cast != {}:
+            columns = cast_columns(columns, cast, tags)
+        elif recast:
+            columns = cast_columns(columns, recast, tags)
+        options = get_write_options(protocol)
+        records = iter_records(times, columns)
+        if window is not None:
+            records = filter_records(records, window)
+        for points in iter_points(meta["measurement"], records,
+                batch_size=batch_size, protocol=protocol, tags=tags):
+            yield (points, options)
+        return
 
-        write_data(c, data, typecast, cast)
+    with open_file(datafile, 'r') as fh:
+        if get_format(datafile) == 'lp':
+            if verbose is True:
+                sys.stdout.write("> loading {} [{}]\n".format(
+                    datafile, datetime.now().isoformat()))
+            options = get_write_options('line')
+            lines = read_lines(fh)
+            if window is not None:
+                lines = filter_lines(lines, window)
+            for lines in iter_batches(lines, batch_size):
+                yield (lines, options)
+            return
 
+        options = get_write_options(protocol)
+        override = read_sidecar(datafile)
+        for (meta, records) in read_documents(fh):
+            if override is not None:
+                meta = override
+            if verbose is True:
+                sys.stdout.write(
+                    "> loading {} in {} [{}]\n".format(
+                    datafile, meta["measurement"],
+                    datetime.now().isoformat()))
 
-def load_folder(
-        c,
-        folder,
-        pattern=None,
-        typecast=False,
-        cast={},
-        verbose=False
-    ):
+            _cast = cast
+            if typecast is True \
+                    and cast == {} \
+                    and "types" in meta:
+                _cast = meta["types"]
+
+            if window is not None:
+                records = filter_records(records, window)
+            for points in iter_points(meta["measurement"], records, typecast,
+                    _cast, batch_size, protocol, meta.get("tags", ())):
+                yield (points, options)
+
+
+def load_file(c, datafile, typecast=False, cast={}, verbose=False,
+        protocol='json'):
+    """Load a dump file, points are written by batches as they are read.
+
+    :param protocol: write protocol for json files, `json` or `line`
+    :type protocol: str
+    """
+    for (points, options) in read_file(datafile, typecast, cast, verbose,
+            protocol=protocol):
+        c.write_points(points, **options)
+
+
+def write_batch(c, batch, sizer=None):
+    """Write a `(points, options)` or `(points, options, ack)` batch, `ack`
+    being called once the batch is written. The write is observed by `sizer`
+    if any.
+    """
+    start = time.monotonic()
+    c.write_points(batch[0], **batch[1])
+    if sizer is not None and batch[0]:
+        sizer.observe(None, len(batch[0]), time.monotonic() - start,
+                record_size(batch[0][0]))
+    if len(batch) > 2 and batch[2] is not None:
+        batch[2]()
+
+
+def write_pipeline(c, produce, items, jobs, queue_size=None, sizer=None):
+    """Write points produced from a list of items with concurrent readers and
+    writers.
+
+    A pool of `jobs` reader threads runs `produce(item)`, a generator of
+    `(points, options)` or `(points, options, ack)` batches, for each item,
+    `ack` being called once the batch is written. Batches go through a bounded
+    queue to `jobs` writer threads, each one using its own client cloned from
+    `c`, so that parsing and http writes overlap. Readers block when the queue
+    is full.
+
+    :param queue_size: maximum number of pending batches, defaults to twice
+        the number of jobs
+    :type queue_size: int
+    :param sizer: sizer observing writes, see `influxdump.sizing.Sizer`
+    :type sizer: influxdump.sizing.Sizer
+    """
+    batches = queue.Queue(maxsize=queue_size or 2 * jobs)
+    stop = threading.Event()
+    errors = []
+
+    def writer():
+        client = None
+        while True:
+            batch = batches.get()
+            if batch is None:
+                return
+            # keep draining the queue after an error so readers never block
+            if stop.is_set():
+                continue
+            try:
+                if client is None:
+                    client = c.clone()
+                write_batch(client, batch, sizer)
+            except BaseException as e:
+                errors.append(e)
+                stop.set()
+
+    def reader(item):
+        for batch in produce(item):
+            if stop.is_set():
+                return
+            batches.put(batch)
 
+    writers = [threading.Thread(target=writer) for _ in range(jobs)]
+    for thread in writers:
+        thread.start()
+
+    try:
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            futures = [executor.submit(reader, item) for item in items]
+            try:
+                for future in futures:
+                    future.result()
+            except BaseException:
+                stop.set()
+                for future in futures:
+                    future.cancel()
+                raise
+    finally:
+        for _ in writers:
+            batches.put(None)
+        for thread in writers:
+            thread.join()
+
+    if errors:
+        raise errors[0]
+
+
+def list_chunks(folder, pattern=None, window=None):
+    """List `(datafile, chunk)` of the chunk files of a dump folder in name
+    order, `chunk` being the catalogue entry of the file (see
+    `influxdump.catalogue.Catalogue`). Only measurements matching `pattern`
+    and, for catalogued folders, chunks with records in the nanosecond range
+    `window` are listed. Folders without a catalogue are scanned, with `None`
+    entries. Files of incremental dumps are listed generation after
+    generation.
+    """
+    generations = list_generations(folder)
+    if generations:
+        return [item for generation in generations
+                for item in list_chunks(generation, pattern, window)]
+
+    catalogue = Catalogue(folder).load()
+    if catalogue.exists():
+        return [(os.path.join(folder, chunk["file"]), chunk)
+                for chunk in catalogue.select(pattern, window)]
+    return [(datafile, None) for datafile in scan_files(folder, pattern)]
+
+
+def group_chunks(chunks):
+    """Group `(datafile, chunk)` items of `list_chunks` by measurement, in
+    order of first appearance.
+
+    :returns: a list of `(measurement, items)` tuples
+    """
+    groups = {}
+    for (datafile, chunk) in chunks:
+        if chunk is not None:
+            measurement = chunk["measurement"]
+        else:
+            # chunk files are in measurement directories
+            measurement = os.path.basename(os.path.dirname(datafile))
+        groups.setdefault(measurement, []).append((datafile, chunk))
+    return list(groups.items())
+
+
+def list_files(folder, pattern=None):
+    """List chunk files of a dump folder in name order, only measurement
+    directories matching `pattern` are considered. Files of incremental dumps
+    are listed generation after generation.
+    """
+    return [datafile for (datafile, _) in list_chunks(folder, pattern)]
+
+
+def scan_files(folder, pattern=None):
+    """List chunk files of a dump folder by scanning measurement directories
+    matching `pattern`.
+    """
     if pattern:
         _pattern = re.compile(pattern)
     else:
         _pattern = None
 
+    files = []
     for entry  in os.scandir(folder):
         if entry.is_dir():
             if _pattern is not None \
@@ -230,6 +1302,226 @@ def load_folder(
                 continue
 
             for filename in os.scandir(entry.path):
-                if not filename.name.endswith('.json'):
+                if get_format(filename.name) is None:
                     continue
-                load_file(c, filename.path, typecast, cast, verbose)
+                files.append(filename.path)
+
+    return sorted(files)
+
+
+def load_files(c, files, typecast=False, cast={}, verbose=False, jobs=1,
+        protocol='json', journal=None, sizer=None, windows={}):
+    """Load a list of dump files.
+
+    :param journal: journal tracking written batches, files or batches it
+        records as loaded are skipped
+    :type journal: influxdump.journal.Journal
+    :param sizer: sizer of write batches, the batch size is chosen for each
+        file from the writes of previous files
+    :type sizer: influxdump.sizing.Sizer
+    :param windows: time range of the records to load of each file, all
+        records of files not listed are loaded
+    :type windows: dict
+    """
+    def read(datafile, batch_size):
+        return read_file(datafile, typecast, cast, verbose, batch_size,
+                protocol, windows.get(datafile))
+
+    def produce(datafile):
+        batch_size = BATCHSIZE if sizer is None else sizer.get_size()
+        if journal is None:
+            return read(datafile, batch_size)
+        return journal.track(datafile, read, batch_size, verbose)
+
+    if jobs > 1:
+        write_pipeline(c, produce, files, jobs, sizer=sizer)
+    else:
+        for datafile in files:
+            for batch in produce(datafile):
+                write_batch(c, batch, sizer)
+
+
+def load_folder(
+        c,
+        folder,
+        pattern=None,
+        typecast=False,
+        cast={},
+        verbose=False,
+        jobs=1,
+        protocol='json',
+        resume=False,
+        journal_path=None,
+        adaptive=False,
+        target_latency=TARGET_LATENCY,
+        memory_budget=MEMORY_BUDGET,
+        start='',
+        end='',
+    ):
+    """Load all chunk files of a dump folder.
+
+    When resuming or given a journal path, progress is recorded in a journal
+    (by default in the folder) so that an interrupted load can be resumed
+    without writing again the batches already acknowledged by the server.
+    Other loads leave the folder untouched, it may be read-only.
+
+    With a time range, only the chunks listed in the catalogue with records in
+    the range are opened, records out of the range are skipped.
+
+    :param jobs: number of concurrent readers and writers
+    :type jobs: int
+    :param protocol: write protocol for json files, `json` or `line`
+    :type protocol: str
+    :param resume: resume the load recorded in the journal, if any, and
+        journal this one
+    :type resume: bool
+    :param journal_path: path of the journal, defaults to `JOURNAL` in the
+        folder when resuming
+    :type journal_path: str
+    :param adaptive: adapt the size of write batches, starting from
+        `BATCHSIZE`, so that writes take about `target_latency` seconds and
+        batches hold at most `memory_budget` bytes
+    :type adaptive: bool
+    :param start: only load points from this RFC3339 timestamp
+    :type start: str
+    :param end: only load points up to this RFC3339 timestamp
+    :type end: str
+    """
+    sizer = None
+    if adaptive is True:
+        sizer = Sizer(BATCHSIZE, target_latency, memory_budget)
+
+    window = None
+    if start or end:
+        window = get_window(start, end)
+
+    journal = None
+    if resume is True or journal_path is not None:
+        journal = Journal(journal_path or os.path.join(folder, JOURNAL),
+                folder)
+        if resume is True:
+            journal.load()
+        journal.open(resume)
+
+    try:
+        # replay generations of incremental dumps in order
+        generations = list_generations(folder)
+        for generation in generations or [folder]:
+            if generations and verbose is True:
+                sys.stdout.write("> loading generation {}\n".format(
+                    generation))
+            files = []
+            windows = {}
+            for (datafile, chunk) in list_chunks(generation, pattern, window):
+                files.append(datafile)
+                if window is not None and (chunk is None
+                        or not Catalogue.contained(chunk, window)):
+                    windows[datafile] = window
+            load_files(c, files, typecast, cast, verbose, jobs, protocol,
+                    journal, sizer, windows)
+    finally:
+        if journal is not None:
+            journal.close()
+
+
+def copy_query(src, query, chunk_size=50000, retry=0, typecast=False,
+        cast={}, verbose=False, protocol='json', probe=None):
+    """Generator of the `(points, options)` write batches of the points of a
+    query, read by chunks from `src`. Values are cast with the types of the
+    chunk metadata when `typecast` is enabled.
+    """
+    options = get_write_options(protocol)
+    for (counter, data) in query_data(src, [query], chunk_size, typecast,
+            cast, retry, probe):
+        if counter is None:
+            continue
+
+        meta = data["meta"]
+        if verbose is True:
+            sys.stdout.write("> copying {} (chunk {:05d}) [{}]\n".format(
+                meta["measurement"], counter, datetime.now().isoformat()))
+        for points in iter_points(meta["measurement"], data["records"],
+                typecast, meta.get("types", {}), protocol=protocol,
+                tags=meta.get("tags", ())):
+            yield (points, options)
+
+
+def copy_data(
+        src,
+        dst,
+        pattern=None,
+        dryrun=False,
+        chunk_size=50000,
+        start='',
+        end='',
+        retry=0,
+        typecast=False,
+        cast={},
+        verbose=False,
+        jobs=1,
+        shard_width=None,
+        shard_size=None,
+        protocol='json',
+        probe='count',
+        queue_size=None
+    ):
+    """Copy data from a database to another without going through files.
+
+    Chunks of the queries of `src` are turned into write batches by `jobs`
+    reader threads and written to `dst` by `jobs` writer threads through a
+    bounded queue (see `write_pipeline`), so that only a few batches are held
+    in memory whatever the size of the data.
+
+    :param src: client of the source database
+    :type src: InfluxDBClient
+    :param dst: client of the destination database
+    :type dst: InfluxDBClient
+    :param dryrun: only list the measurements that would be copied, nothing
+        is written to `dst`
+    :type dryrun: bool
+    :param shard_width: split queries in time windows of fixed width
+    :type shard_width: timedelta
+    :param shard_size: split queries in time windows of about `shard_size`
+        points
+    :type shard_size: int
+    :param protocol: write protocol, `json` or `line`
+    :type protocol: str
+    :param probe: strategy used to skip queries without data, see
+        `DataProbe`
+    :type probe: str
+    :param queue_size: maximum number of pending write batches, defaults to
+        twice the number of jobs
+    :type queue_size: int
+    """
+    measurements = src.get_measurements(pattern)
+    if verbose is True or dryrun is True:
+        sys.stdout.write("> {} measurements matched\n".format(
+            len(measurements)))
+    if dryrun is True:
+        sys.stdout.write("> following measurements would be copied:\n")
+        for m in measurements:
+            sys.stdout.write("    {}\n".format(m))
+        return
+
+    probe = DataProbe(probe)
+    queries = get_queries(measurements, start=start, end=end)
+    if shard_width is not None or shard_size is not None:
+        queries = plan_queries(src, queries, jobs, shard_width, shard_size,
+                verbose, probe)
+
+    if src.has_tags is True:
+        src.schema.discover(src, measurements,
+                fields=typecast is True and cast == {})
+
+    probe.prepare(src, queries)
+
+    # each reader thread uses its own source client
+    local = threading.local()
+
+    def produce(query):
+        if not hasattr(local, "client"):
+            local.client = src.clone()
+        return copy_query(local.client, query, chunk_size, retry, typecast,
+                cast, verbose, protocol, probe)
+
+    write_pipeline(dst, produce, queries, jobs, queue_size)
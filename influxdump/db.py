@@ -1,27 +1,234 @@
 # -*- coding: utf-8 -*-
+from datetime import datetime, timedelta, timezone
+import json
+import os
 import re
+import threading
+import time
+
+from .cast import CONVERTERS, cast_records, compile_cast
+
+
+RFC3339 = re.compile(
+    r'^(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})(?:\.(\d+))?(Z|[+-]\d{2}:\d{2})$')
+DURATION = re.compile(r'^(\d+)(s|m|h|d|w)$')
+DURATION_UNITS = {
+    's': 'seconds',
+    'm': 'minutes',
+    'h': 'hours',
+    'd': 'days',
+    'w': 'weeks',
+}
+
+# seconds after which an on-disk schema snapshot is discovered again
+SCHEMA_TTL = 3600
+
+# number of measurements per bulk schema discovery query
+DISCOVERY_SIZE = 500
+
+# number of http connections kept alive by a client
+POOLSIZE = 10
+
+
+class SchemaCache(object):
+    """Cache of the schema of a database: measurements, field keys with their
+    types and tag keys of each measurement.
+
+    Discovery queries are run at most once per measurement and shared by all
+    clients cloned from the same client. The schema can be saved as a json
+    snapshot and reused by later runs until it is older than `ttl` seconds.
+    """
+    def __init__(self, path=None, ttl=SCHEMA_TTL, source=None):
+        self.path = path
+        self.ttl = ttl
+        self.source = source
+        self.time = None
+        self.measurements = None
+        self.fields = {}
+        self.tags = {}
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Read the snapshot if it exists, is fresh and was taken from the
+        same source.
+        """
+        if self.path is None or not os.path.exists(self.path):
+            return self
+
+        with open(self.path, 'r') as fd:
+            try:
+                snapshot = json.load(fd)
+            except ValueError:
+                return self
+        if snapshot.get("source") != self.source:
+            return self
+        if self.ttl is not None and time.time() - snapshot["time"] > self.ttl:
+            return self
+
+        self.time = snapshot["time"]
+        self.measurements = snapshot["measurements"]
+        self.fields = snapshot["fields"]
+        self.tags = snapshot["tags"]
+        return self
+
+    def save(self):
+        """Write the snapshot, atomically replacing the previous one"""
+        if self.path is None:
+            return
+
+        with self._lock:
+            snapshot = {
+                "source": self.source,
+                "time": self.time or time.time(),
+                "measurements": self.measurements,
+                "fields": self.fields,
+                "tags": self.tags,
+            }
+            tmp = "{}.tmp".format(self.path)
+            with open(tmp, 'w') as fd:
+                json.dump(snapshot, fd)
+            os.replace(tmp, self.path)
+
+    def get_measurements(self, c):
+        """Return all measurements of the database"""
+        if self.measurements is None:
+            res = c.show_measurements()
+            self.measurements = [point["name"] for point in c.get_points(res)]
+        return self.measurements
+
+    def get_fields(self, c, query):
+        """Return the fields of the measurement of a query as a dict of field
+        types, types are None when the server does not provide them.
+        """
+        if query.measurement not in self.fields:
+            res = c.query(query.get_meta_query())
+            self._add_fields(query.measurement, res.get_points())
+        return self.fields[query.measurement]
+
+    def discover(self, c, measurements, fields=True, tags=True,
+            size=DISCOVERY_SIZE):
+        """Discover the schema of many measurements at once, with one
+        `SHOW FIELD KEYS` and one `SHOW TAG KEYS` query per `size`
+        measurements. Measurements already in the cache are not queried.
+
+        :param fields: discover field keys and types
+        :type fields: bool
+        :param tags: discover tag keys
+        :type tags: bool
+        """
+        todo = []
+        if fields is True:
+            todo.append(("SHOW FIELD KEYS FROM {}", self.fields,
+                self._add_fields))
+        if tags is True:
+            todo.append(("SHOW TAG KEYS FROM {}", self.tags, self._add_tags))
+
+        for (q, cache, add) in todo:
+            missing = [m for m in measurements if m not in cache]
+            for i in range(0, len(missing), size):
+                batch = missing[i:i + size]
+                res = c.query(q.format(
+                    ", ".join('"{}"'.format(m) for m in batch)))
+                found = {}
+                for ((measurement, _), points) in res.items():
+                    found[measurement] = list(points)
+                # measurements without any key are not in the results
+                for measurement in batch:
+                    add(measurement, found.get(measurement, []))
+
+    def _add_fields(self, measurement, points):
+        self.fields[measurement] = {p['fieldKey']: p.get('fieldType')
+                for p in points}
+
+    def _add_tags(self, measurement, points):
+        self.tags[measurement] = sorted(p['tagKey'] for p in points)
+
+    def get_tags(self, c, query):
+        """Return the sorted tag keys of the measurement of a query"""
+        if query.measurement not in self.tags:
+            res = c.query(query.get_tags_query())
+            self._add_tags(query.measurement, res.get_points())
+        return self.tags[query.measurement]
 
 
 class InfluxDBClient(object):
+    # legacy servers have no tags
+    has_tags = True
+
     def __init__(self,
             host,
             port,
             user,
             pwd,
             db,
+            schema=None,
+            gzip=False,
+            msgpack=False,
+            pool_size=POOLSIZE,
+            timeout=None,
     ):
+        """
+        :param gzip: compress request bodies and ask for compressed responses
+        :type gzip: bool
+        :param msgpack: ask for msgpack responses instead of json, servers
+            not supporting it (< 1.4) answer with json
+        :type msgpack: bool
+        :param pool_size: number of http connections kept alive
+        :type pool_size: int
+        :param timeout: `(connect, read)` timeouts in seconds, None for no
+            timeout
+        :type timeout: tuple
+        """
         import influxdb
 
+        self.schema = schema or SchemaCache()
+        self._params = {
+                "host": host,
+                "port": port,
+                "user": user,
+                "pwd": pwd,
+                "db": db,
+                "gzip": gzip,
+                "msgpack": msgpack,
+                "pool_size": pool_size,
+                "timeout": timeout,
+        }
+        self._msgpack = msgpack
+        if msgpack is True:
+            # the influxdb library asks for msgpack by default
+            headers = None
+        else:
+            headers = {'Accept': 'application/json'}
         self._client = influxdb.InfluxDBClient(
                 host=host,
                 port=port,
                 username=user,
                 password=pwd,
                 database=db,
-                headers={'Accept': 'application/json'},
+                headers=headers,
+                gzip=gzip,
+                pool_size=pool_size,
+                timeout=timeout,
         )
 
+    def clone(self):
+        """Return a new client using the same connection parameters. The
+        underlying http session is not thread safe, each worker has to use its
+        own client. The schema cache is shared.
+        """
+        return self.__class__(schema=self.schema, **self._params)
+
     def query(self, *args, **kwargs):
+        if self._msgpack is True and kwargs.get("chunked") is True:
+            # chunked responses are read as json lines by the influxdb
+            # library, the request is sent before query() returns
+            headers = self._client._headers
+            accept = headers['Accept']
+            headers['Accept'] = 'application/json'
+            try:
+                return self._client.query(*args, **kwargs)
+            finally:
+                headers['Accept'] = accept
         return self._client.query(*args, **kwargs)
 
     def show_measurements(self):
@@ -39,10 +246,8 @@ class InfluxDBClient(object):
         :param pattern: a pattern to match measurements
         :tuype pattern: string
         """
-        res = self.show_measurements()
         measurements = []
-        for point in self.get_points(res):
-            measurement = point["name"]
+        for measurement in self.schema.get_measurements(self):
             if pattern is None:
                 measurements.append(measurement)
             else:
@@ -56,9 +261,21 @@ class InfluxDBClient(object):
 
 
 class InfluxDB08Client(InfluxDBClient):
-    def __init__(self, host, port, user, pwd, db):
+    has_tags = False
+
+    def __init__(self, host, port, user, pwd, db, schema=None):
         import influxdb.influxdb08 as influxdb
 
+        self.schema = schema or SchemaCache()
+        self._params = {
+                "host": host,
+                "port": port,
+                "user": user,
+                "pwd": pwd,
+                "db": db,
+        }
+        # the legacy api has no msgpack support
+        self._msgpack = False
         self._client = influxdb.InfluxDBClient(
                 host=host,
                 port=port,
@@ -79,15 +296,50 @@ class InfluxDB08Client(InfluxDBClient):
             yield _point
 
 
-def get_client(host, port, user, pwd, db, legacy=False):
-    """Return a configured influxdb client"""
-    if legacy:
+def get_schema(host, port, db, path=None, ttl=SCHEMA_TTL):
+    """Return a schema cache for a database, loaded from the snapshot in
+    `path` if any.
+    """
+    source = "{}:{}/{}".format(host, port, db)
+    return SchemaCache(path, ttl, source).load()
+
+
+def get_client(host, port, user, pwd, db, legacy=False, schema=None,
+        backend='requests', gzip=False, msgpack=False, pool_size=POOLSIZE,
+        timeout=None):
+    """Return a configured influxdb client, http options are not supported by
+    the legacy client, see `InfluxDBClient` for their meaning.
+
+    :param backend: `requests` for the synchronous `influxdb` client,
+        `asyncio` for `influxdump.aio.AioInfluxDBClient`
+    :type backend: str
+    """
+    options = {
+        "gzip": gzip,
+        "msgpack": msgpack,
+        "pool_size": pool_size,
+        "timeout": timeout,
+    }
+    if backend == 'asyncio':
+        from .aio import AioInfluxDBClient
+
+        return AioInfluxDBClient(
+                host=host,
+                port=port,
+                user=user,
+                pwd=pwd,
+                db=db,
+                schema=schema,
+                **options
+        )
+    elif legacy:
         return InfluxDB08Client(
                 host=host,
                 port=port,
                 user=user,
                 pwd=pwd,
                 db=db,
+                schema=schema,
         )
     else:
         return InfluxDBClient(
@@ -96,6 +348,8 @@ def get_client(host, port, user, pwd, db, legacy=False):
                 user=user,
                 pwd=pwd,
                 db=db,
+                schema=schema,
+                **options
         )
 
 
@@ -103,20 +357,29 @@ class Query(object):
     measurement = None
     q = "SELECT * FROM \"{measurement}\""
     m = "SHOW FIELD KEYS FROM \"{measurement}\""
+    t = "SHOW TAG KEYS FROM \"{measurement}\""
     ctx = {}
 
     def __init__(self, measurement, q=None, ctx={}):
         self.measurement = measurement
         if q is not None:
             self.q = q
-        if ctx['start'] != '' or ctx['end'] !='':
+        start = ctx.get('start', '')
+        end = ctx.get('end', '')
+        if start != '' or end != '':
             self.q += " WHERE "
-            if ctx['start'] != '':
-                self.q += "time >= '{start}'"
-            if ctx['start'] != '' and ctx['end'] != '':
+            if start != '':
+                if ctx.get('exclusive_start') is True:
+                    self.q += "time > '{start}'"
+                else:
+                    self.q += "time >= '{start}'"
+            if start != '' and end != '':
                 self.q += " AND "
-            if ctx['end'] != '':
-                self.q += "time <= '{end}'"
+            if end != '':
+                if ctx.get('exclusive_end') is True:
+                    self.q += "time < '{end}'"
+                else:
+                    self.q += "time <= '{end}'"
         self.ctx = ctx
 
     def __repr__(self):
@@ -138,6 +401,10 @@ class Query(object):
         _ctx = {"measurement": self.measurement}
         return self.m.format(**_ctx)
 
+    def get_tags_query(self):
+        _ctx = {"measurement": self.measurement}
+        return self.t.format(**_ctx)
+
     def get_meta(self):
         return {
             "measurement": self.measurement,
@@ -145,6 +412,51 @@ class Query(object):
             "context": self.ctx,
         }
 
+    def resume(self, start, exclusive=False):
+        """Return a copy of the query starting at `start`, other boundaries
+        and context are kept.
+
+        :param exclusive: exclude points at `start`
+        :type exclusive: bool
+        """
+        ctx = dict(self.ctx)
+        ctx["start"] = start
+        if exclusive is True:
+            ctx["exclusive_start"] = True
+        else:
+            ctx.pop("exclusive_start", None)
+        return Query(self.measurement, ctx=ctx)
+
+    def shard(self, windows):
+        """Split the query in sub-queries, one per time window.
+
+        Every window but the last one excludes its end boundary so that
+        windows do not overlap, and only the first one keeps the exclusive
+        start boundary of the query, next ones start on the previous end. The
+        window boundaries and position are kept in the context of each
+        sub-query.
+
+        :param windows: list of `(start, end)` boundaries, an empty string
+            meaning an open boundary
+        :type windows: list
+        """
+        queries = []
+        for (i, (start, end)) in enumerate(windows):
+            ctx = dict(self.ctx)
+            ctx.update({
+                "start": start,
+                "end": end,
+                "shard": i + 1,
+                "shards": len(windows),
+            })
+            if i > 0:
+                ctx.pop("exclusive_start", None)
+            if i < len(windows) - 1:
+                ctx["exclusive_end"] = True
+            queries.append(Query(self.measurement, ctx=ctx))
+
+        return queries
+
 
 def get_queries(measurements, start='', end=''):
     queries = []
@@ -155,29 +467,105 @@ def get_queries(measurements, start='', end=''):
     return queries
 
 
-def cast_value(name, value, cast={}):
-    if name in cast:
-        type = __builtins__[cast[name]]
-        return type(value)
-    elif '*' in cast:
-        type = __builtins__[cast['*']]
-        return type(value)
-    return value
+def parse_time(value):
+    """Parse a RFC3339 timestamp into an aware datetime, sub-microsecond
+    precision is dropped.
+    """
+    m = RFC3339.match(value)
+    if m is None:
+        raise ValueError("Invalid RFC3339 timestamp: {}".format(value))
+    dt = datetime.strptime(m.group(1), "%Y-%m-%dT%H:%M:%S")
+    if m.group(2) is not None:
+        dt = dt.replace(microsecond=int(m.group(2)[:6].ljust(6, '0')))
+    if m.group(3) == 'Z':
+        tz = timezone.utc
+    else:
+        offset = timedelta(hours=int(m.group(3)[1:3]),
+                minutes=int(m.group(3)[4:6]))
+        if m.group(3)[0] == '-':
+            offset = -offset
+        tz = timezone(offset)
+    return dt.replace(tzinfo=tz)
+
+
+def format_time(dt):
+    """Format an aware datetime as a RFC3339 UTC timestamp"""
+    dt = dt.astimezone(timezone.utc)
+    value = dt.strftime("%Y-%m-%dT%H:%M:%S")
+    if dt.microsecond:
+        value += ".{:06d}".format(dt.microsecond)
+    return value + "Z"
+
+
+def parse_duration(value):
+    """Parse a duration such as `30m`, `6h` or `7d` into a timedelta"""
+    m = DURATION.match(value)
+    if m is None:
+        raise ValueError("Invalid duration: {}".format(value))
+    return timedelta(**{DURATION_UNITS[m.group(2)]: int(m.group(1))})
+
+
+def get_windows(first, last, width, start='', end=''):
+    """Compute consecutive time windows of `width` covering `[first, last]`.
+
+    `start` and `end` are the boundaries of the original query, they are kept
+    for the first and last windows so that windows cover exactly the same
+    time range as the original query.
+
+    :param first: time of the first window
+    :type first: datetime
+    :param last: time of the end of the last window
+    :type last: datetime
+    :param width: width of each window
+    :type width: timedelta
+    """
+    edges = [start]
+    t = first + width
+    while t < last:
+        edges.append(format_time(t))
+        t += width
+    edges.append(end)
+
+    return list(zip(edges[:-1], edges[1:]))
 
 
-def data_to_points(measurement, records, typecast=False, cast={}):
+def cast_value(name, value, cast={}):
+    """Cast a single value, batches of records are cast with a compiled cast
+    plan instead, see `influxdump.cast`.
+    """
+    _type = cast.get(name, cast.get('*'))
+    if _type is None:
+        return value
+    return CONVERTERS[_type](value)
+
+
+def data_to_points(measurement, records, typecast=False, cast={}, tags=()):
+    """Build points from records, columns listed in `tags` are written as
+    tags, other columns as fields. Values are cast by batch with a cast plan
+    compiled once for the columns of the records (see `influxdump.cast`).
+    """
+    if cast and records:
+        cast_records(records, compile_cast(cast, records[0], tags))
+
     points = []
     for record in records:
-        ts = record.pop("time")
         fields = {}
+        _tags = {}
         for name, value in record.items():
-            if value is not None:
-                fields[name] = cast_value(name, value, cast)
+            if value is None or name == "time":
+                continue
+            if name in tags:
+                _tags[name] = str(value)
+            else:
+                fields[name] = value
         if fields:
-            points.append({
+            point = {
                 "measurement": measurement,
-                "time": ts,
+                "time": record["time"],
                 "fields": fields,
-            })
+            }
+            if _tags:
+                point["tags"] = _tags
+            points.append(point)
 
     return points
@@ -5,3 +5,12 @@ class InfluxdumpException(Exception):
 
 class TypecastError(InfluxdumpException):
     pass
+
+class CompressionError(InfluxdumpException):
+    pass
+
+class ManifestError(InfluxdumpException):
+    pass
+
+class RecastError(InfluxdumpException):
+    pass
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""Progress journal of a load.
+
+Like the dump manifest, the journal is an append-only file of json events,
+one per line: the fingerprint (size and modification time) and batch size of
+each file when its loading starts, each acknowledged batch and completed
+files. Batches are acknowledged once written, possibly out of order when
+several writers are used, a file is resumed from its first unacknowledged
+batch. Files are not read to be fingerprinted, a load reads them only once.
+"""
+import json
+import os
+import sys
+import threading
+
+
+JOURNAL = "load-journal.jsonl"
+
+
+def fingerprint(path):
+    """Return the size and modification time of a file, changed whenever the
+    file is rewritten.
+    """
+    stat = os.stat(path)
+    return "{}:{}".format(stat.st_size, stat.st_mtime_ns)
+
+
+class Journal(object):
+    def __init__(self, path, folder):
+        self.path = path
+        self.folder = folder
+        self.files = {}
+        self._lock = threading.Lock()
+        self._fd = None
+
+    def load(self):
+        """Read events of a previous run, if any"""
+        if not os.path.exists(self.path):
+            return self
+
+        with open(self.path, 'r') as fd:
+            for line in fd:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    # interrupted while writing the last event
+                    break
+                self._apply(event)
+
+        return self
+
+    def _apply(self, event):
+        if event["event"] == "file":
+            self.files[event["file"]] = {
+                # missing from journals of older versions
+                "fingerprint": event.get("fingerprint"),
+                "batch_size": event["batch_size"],
+                "acked": set(),
+                "batches": None,
+                "complete": False,
+            }
+            return
+
+        entry = self.files[event["file"]]
+        if event["event"] == "batch":
+            entry["acked"].add(event["batch"])
+        elif event["event"] == "read":
+            entry["batches"] = event["batches"]
+        elif event["event"] == "complete":
+            entry["complete"] = True
+
+    def open(self, resume=False):
+        """Open the journal for writing, previous events are kept when
+        resuming.
+        """
+        self._fd = open(self.path, 'a' if resume else 'w')
+        return self
+
+    def close(self):
+        if self._fd is not None:
+            self._fd.close()
+            self._fd = None
+
+    def _record(self, event):
+        with self._lock:
+            self._apply(event)
+            self._fd.write(json.dumps(event) + "\n")
+            self._fd.flush()
+            entry = self.files[event["file"]]
+            if event["event"] != "complete" \
+                    and entry["complete"] is False \
+                    and entry["batches"] is not None \
+                    and len(entry["acked"]) >= entry["batches"]:
+                event = {"event": "complete", "file": event["file"]}
+                self._apply(event)
+                self._fd.write(json.dumps(event) + "\n")
+                self._fd.flush()
+
+    def get_resume_batch(self, key, fp):
+        """Return the index of the first batch to load for a file, None if the
+        file has been completely loaded. Files that changed since they were
+        journaled are loaded again.
+        """
+        entry = self.files.get(key)
+        if entry is None or entry["fingerprint"] != fp:
+            return 0
+        if entry["complete"] is True:
+            return None
+        batch = 0
+        while batch in entry["acked"]:
+            batch += 1
+        return batch
+
+    def track(self, datafile, read, batch_size, verbose=False):
+        """Wrap the generator of `(points, options)` batches of a file
+        returned by `read(datafile, batch_size)` into a generator of
+        `(points, options, ack)`, `ack` being the callback acknowledging the
+        write of the batch. Batches acknowledged by a previous run are
+        skipped, a partially loaded file is read again with the batch size
+        it was loaded with so that batches are the same.
+        """
+        key = os.path.relpath(datafile, self.folder)
+        fp = fingerprint(datafile)
+        first = self.get_resume_batch(key, fp)
+        if first is None:
+            if verbose is True:
+                sys.stdout.write("> Skipping loaded {}\n".format(datafile))
+            return
+        if first > 0 and verbose is True:
+            sys.stdout.write("> Resuming {} from batch {}\n".format(
+                datafile, first))
+
+        acked = set()
+        if first > 0:
+            acked = self.files[key]["acked"]
+            batch_size = self.files[key]["batch_size"]
+        self._record({"event": "file", "file": key, "fingerprint": fp,
+            "batch_size": batch_size})
+        for batch in acked:
+            self._record({"event": "batch", "file": key, "batch": batch})
+
+        count = 0
+        for (i, (points, options)) in enumerate(read(datafile, batch_size)):
+            count = i + 1
+            if i < first:
+                continue
+            yield (points, options, self._ack_callback(key, i))
+
+        self._record({"event": "read", "file": key, "batches": count})
+
+    def _ack_callback(self, key, batch):
+        def ack():
+            self._record({"event": "batch", "file": key, "batch": batch})
+        return ack
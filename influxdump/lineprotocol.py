@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""Encoding of dump records in InfluxDB line protocol.
+
+Records are encoded directly in lines, without building intermediate point
+dicts, with nanosecond precision timestamps.
+"""
+import calendar
+from itertools import islice
+import time
+
+from .cast import cast_records, compile_cast
+from .db import RFC3339
+
+
+# number of records cast at once
+CAST_BATCH = 1000
+
+_epoch_days = {}
+
+
+def rfc3339_to_ns(value):
+    """Convert a RFC3339 timestamp to nanoseconds since epoch, integers are
+    considered to already be nanosecond timestamps.
+    """
+    if isinstance(value, int):
+        return value
+
+    m = RFC3339.match(value)
+    if m is None:
+        raise ValueError("Invalid RFC3339 timestamp: {}".format(value))
+
+    day = value[:10]
+    seconds = _epoch_days.get(day)
+    if seconds is None:
+        seconds = calendar.timegm(time.strptime(day, "%Y-%m-%d"))
+        _epoch_days[day] = seconds
+    seconds += int(value[11:13]) * 3600 \
+            + int(value[14:16]) * 60 \
+            + int(value[17:19])
+
+    tz = m.group(3)
+    if tz != 'Z':
+        offset = int(tz[1:3]) * 3600 + int(tz[4:6]) * 60
+        if tz[0] == '-':
+            seconds += offset
+        else:
+            seconds -= offset
+
+    ns = seconds * 1000000000
+    if m.group(2) is not None:
+        ns += int(m.group(2)[:9].ljust(9, '0'))
+    return ns
+
+
+def escape_measurement(value):
+    return value.replace(',', '\\,').replace(' ', '\\ ')
+
+
+def escape_key(value):
+    return value.replace(',', '\\,').replace('=', '\\=').replace(' ', '\\ ')
+
+
+def encode_value(value):
+    """Encode a field value based on its python type"""
+    # bool is a subclass of int, test it first
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, int):
+        return '{}i'.format(value)
+    if isinstance(value, float):
+        return repr(value)
+    return '"{}"'.format(
+        str(value).replace('\\', '\\\\').replace('"', '\\"'))
+
+
+def get_series_key(record, tags):
+    """Return the sort key of the series of a record, `tags` being the tag
+    keys in order.
+    """
+    return tuple(record.get(tag) or '' for tag in tags)
+
+
+def encode_records(measurement, records, cast={}, tags=()):
+    """Generator of line protocol lines built from dump records, values are
+    cast by batches of `CAST_BATCH` records with a cast plan compiled once
+    (see `influxdump.cast`). Columns listed in `tags` are encoded as tags, in
+    key order as recommended for the line protocol. Records without any field
+    value are skipped.
+    """
+    measurement = escape_measurement(measurement)
+    tags = sorted(tags)
+    tag_keys = [',' + escape_key(tag) + '=' for tag in tags]
+    keys = {}
+
+    if cast:
+        records = _cast_batches(records, cast, tags)
+
+    for record in records:
+        prefix = measurement
+        for (tag, key) in zip(tags, tag_keys):
+            value = record.get(tag)
+            if value is not None and value != '':
+                prefix += key + escape_key(str(value))
+        prefix += ' '
+
+        fields = []
+        for (name, value) in record.items():
+            if name == 'time' or value is None or name in tags:
+                continue
+
+            if name not in keys:
+                keys[name] = escape_key(name) + '='
+            fields.append(keys[name] + encode_value(value))
+
+        if fields:
+            yield '{}{} {}'.format(prefix, ','.join(fields),
+                    rfc3339_to_ns(record['time']))
+
+
+def _cast_batches(records, cast, tags):
+    """Generator of records cast by batches, with a cast plan compiled for the
+    columns of each batch.
+    """
+    records = iter(records)
+    while True:
+        batch = list(islice(records, CAST_BATCH))
+        if not batch:
+            return
+        cast_records(batch, compile_cast(cast, batch[0], tags))
+        for record in batch:
+            yield record
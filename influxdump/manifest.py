@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""Progress manifest of a dump folder.
+
+The manifest is an append-only file of json events, one per line, recording
+the planned queries, each committed chunk and completed queries. A truncated
+last line (e.g. after a crash) is ignored when the manifest is read back.
+
+Incremental dumps are made of generation folders (`gen-00000`, `gen-00001`,
+...) in a root folder, each one being a dump folder with its own manifest.
+"""
+import json
+import os
+import re
+import threading
+
+from .db import Query
+from .lineprotocol import rfc3339_to_ns
+
+
+MANIFEST = "manifest.jsonl"
+
+GENERATION = "gen-{:05d}"
+
+_generation = re.compile(r'^gen-(\d{5})$')
+
+
+def list_generations(folder):
+    """List generation folders of an incremental dump in order"""
+    if not os.path.isdir(folder):
+        return []
+    generations = []
+    for entry in os.scandir(folder):
+        if entry.is_dir() and _generation.match(entry.name):
+            generations.append(entry.path)
+    return sorted(generations)
+
+
+def get_key(query):
+    """Return the manifest key of a query, stable across resumed runs"""
+    if "shard" in query.ctx:
+        return "{}-{:05d}".format(query.measurement, query.ctx["shard"])
+    return query.measurement
+
+
+class Manifest(object):
+    def __init__(self, folder):
+        self.path = os.path.join(folder, MANIFEST)
+        self.plan = None
+        self.entries = {}
+        self._lock = threading.Lock()
+        self._fd = None
+
+    def load(self):
+        """Read events of a previous run, if any"""
+        if not os.path.exists(self.path):
+            return self
+
+        with open(self.path, 'r') as fd:
+            for line in fd:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    # interrupted while writing the last event
+                    break
+                self._apply(event)
+
+        return self
+
+    def _apply(self, event):
+        if event["event"] == "plan":
+            self.plan = event["queries"]
+            return
+
+        entry = self.entries.setdefault(event["key"], {
+            "measurement": event["measurement"],
+            "complete": False,
+            "chunks": {},
+        })
+        if event["event"] == "chunk":
+            entry["chunks"][event["chunk"]] = {
+                "file": event["file"],
+                "records": event["records"],
+                "first": event["first"],
+                "last": event["last"],
+                # missing from manifests of older versions
+                "meta": event.get("meta"),
+                "info": event.get("info"),
+            }
+        elif event["event"] == "complete":
+            entry["complete"] = True
+
+    def open(self, resume=False):
+        """Open the manifest for writing, previous events are kept when
+        resuming.
+        """
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._fd = open(self.path, 'a' if resume else 'w')
+        return self
+
+    def close(self):
+        if self._fd is not None:
+            self._fd.close()
+            self._fd = None
+
+    def _record(self, event):
+        with self._lock:
+            self._apply(event)
+            self._fd.write(json.dumps(event) + "\n")
+            self._fd.flush()
+
+    def get_queries(self):
+        """Return the queries of the recorded plan, None if no plan"""
+        if self.plan is None:
+            return None
+        return [Query(q["measurement"], ctx=q["context"]) for q in self.plan]
+
+    def set_plan(self, queries):
+        self._record({
+            "event": "plan",
+            "queries": [{"measurement": q.measurement, "context": q.ctx}
+                for q in queries],
+        })
+
+    def get(self, query):
+        return self.entries.get(get_key(query))
+
+    def add_chunk(self, query, counter, filename, records, first, last,
+            meta=None, info=None):
+        """Record a committed chunk, `meta` and `info` (size and checksum of
+        the file) are kept for the catalogue of the folder.
+        """
+        self._record({
+            "event": "chunk",
+            "key": get_key(query),
+            "measurement": query.measurement,
+            "chunk": counter,
+            "file": filename,
+            "records": records,
+            "first": first,
+            "last": last,
+            "meta": meta,
+            "info": info,
+        })
+
+    def complete(self, query):
+        self._record({
+            "event": "complete",
+            "key": get_key(query),
+            "measurement": query.measurement,
+        })
+
+    def is_complete(self):
+        """Test if every planned query has been completed"""
+        if self.plan is None:
+            return False
+        for q in self.get_queries():
+            entry = self.get(q)
+            if entry is None or entry["complete"] is False:
+                return False
+        return True
+
+    def get_chunks(self):
+        """Generator of `(measurement, chunk)` of all committed chunks"""
+        for entry in self.entries.values():
+            for chunk in entry["chunks"].values():
+                yield (entry["measurement"], chunk)
+
+    def get_newest(self):
+        """Return the time of the newest dumped record of each measurement"""
+        newest = {}
+        for entry in self.entries.values():
+            for chunk in entry["chunks"].values():
+                last = chunk["last"]
+                if last is None:
+                    continue
+                current = newest.get(entry["measurement"])
+                if current is None \
+                        or rfc3339_to_ns(last) > rfc3339_to_ns(current):
+                    newest[entry["measurement"]] = last
+        return newest
+
+    def get_last(self, query):
+        """Return `(chunk, time)` of the last committed chunk of a query with
+        records, `(0, None)` if none.
+        """
+        entry = self.get(query)
+        if entry is None:
+            return (0, None)
+        last = (0, None)
+        for (counter, chunk) in sorted(entry["chunks"].items()):
+            last = (counter, chunk["last"] or last[1])
+        return last
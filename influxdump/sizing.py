@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""Adaptive sizing of query chunks and write batches.
+
+A `Sizer` keeps moving averages of the time taken and of the memory used per
+record, and proposes the largest size meeting both a latency target and a
+memory budget. Averages are kept per key (e.g. per measurement, as their
+shapes differ) and for all keys under `None`. A key without observations
+gets the initial size: the records of a measurement can be much larger than
+the ones of others. Chunked queries are streamed with a single size, a stream
+is restarted with the proposed size once it is `RESIZE` times larger or
+smaller.
+"""
+import sys
+import threading
+
+
+# target duration of a request, in seconds
+TARGET_LATENCY = 2.0
+
+# memory held by a chunk or a batch, in bytes
+MEMORY_BUDGET = 64 << 20
+
+MIN_SIZE = 100
+MAX_SIZE = 1000000
+
+# weight of a new observation in moving averages
+SMOOTHING = 0.3
+
+# ratio between the proposed size and the size of a running stream above which
+# the stream is restarted
+RESIZE = 2
+
+
+def record_size(record):
+    """Estimate the memory used by a record or a point, values of nested
+    dicts included.
+    """
+    size = sys.getsizeof(record)
+    if isinstance(record, dict):
+        for value in record.values():
+            size += record_size(value)
+    return size
+
+
+class Sizer(object):
+    def __init__(self, initial, latency=TARGET_LATENCY, memory=MEMORY_BUDGET,
+            minimum=MIN_SIZE, maximum=MAX_SIZE):
+        self.initial = initial
+        self.latency = latency
+        self.memory = memory
+        self.minimum = minimum
+        self.maximum = maximum
+        # key -> [seconds per record, bytes per record]
+        self.stats = {}
+        self._lock = threading.Lock()
+
+    def observe(self, key, count, seconds, size):
+        """Record a request of `count` records taking `seconds`, `size`
+        being the memory used by one record.
+        """
+        if count <= 0:
+            return
+        sample = (seconds / count, size)
+        with self._lock:
+            for k in set([key, None]):
+                stats = self.stats.get(k)
+                if stats is None:
+                    self.stats[k] = list(sample)
+                else:
+                    for i in range(2):
+                        stats[i] += SMOOTHING * (sample[i] - stats[i])
+
+    def get_size(self, key=None):
+        """Return the number of records to ask for in the next request of
+        `key`, `None` for the averages of all requests.
+        """
+        stats = self.stats.get(key)
+        if stats is None:
+            return self.initial
+
+        (seconds, size) = stats
+        sizes = [self.maximum]
+        if seconds > 0:
+            sizes.append(self.latency / seconds)
+        if size > 0:
+            sizes.append(self.memory / size)
+        return max(self.minimum, int(min(sizes)))
+
+    def resize(self, key, size):
+        """Return the size proposed for the requests of `key` when requests of
+        `size` records are at least `RESIZE` times too large or too small, None
+        otherwise.
+        """
+        proposed = self.get_size(key)
+        if proposed >= size * RESIZE or proposed * RESIZE <= size:
+            return proposed
+        return None
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""Incremental (de)serialization of dump chunks.
+
+A chunk is a json document `{"meta": {...}, "records": [{...}, ...]}`, records
+are written and read one at a time so that a chunk never has to be held in
+memory.
+"""
+import json
+
+
+_encode = json.JSONEncoder().encode
+_decoder = json.JSONDecoder()
+
+
+def write_document(fd, meta, records):
+    """Serialize a chunk on a text file object, `records` can be any iterable
+    and is consumed lazily. The output is the same as `json.dump()` on the
+    whole document.
+
+    :returns: the number of records written
+    """
+    fd.write('{"meta": ')
+    fd.write(_encode(meta))
+    fd.write(', "records": [')
+    count = 0
+    for record in records:
+        if count > 0:
+            fd.write(', ')
+        fd.write(_encode(record))
+        count += 1
+    fd.write(']}')
+
+    return count
+
+
+class DocumentReader(object):
+    """Incremental parser for a text file object holding one or more chunk
+    documents, the file is read by blocks of `bufsize` characters.
+    """
+    def __init__(self, fd, bufsize=65536):
+        self._fd = fd
+        self._bufsize = bufsize
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self):
+        data = self._fd.read(self._bufsize)
+        if data == '':
+            self._eof = True
+        self._buf = self._buf[self._pos:] + data
+        self._pos = 0
+
+    def _peek(self):
+        """Skip whitespaces, return the next character, '' at end of file"""
+        while True:
+            while self._pos < len(self._buf) \
+                    and self._buf[self._pos] in ' \t\n\r':
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if self._eof:
+                return ''
+            self._fill()
+
+    def _expect(self, chars):
+        c = self._peek()
+        if c == '' or c not in chars:
+            raise ValueError("Expecting one of '{}' at {!r}".format(
+                chars, self._buf[self._pos:self._pos + 20]))
+        self._pos += 1
+        return c
+
+    def _value(self):
+        self._peek()
+        while True:
+            try:
+                (value, end) = _decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+                self._fill()
+                continue
+            # a number could be cut at the end of the buffer
+            if end == len(self._buf) and not self._eof:
+                self._fill()
+                continue
+            self._pos = end
+            return value
+
+    def _array(self):
+        self._expect('[')
+        if self._peek() == ']':
+            self._pos += 1
+            return
+        while True:
+            yield self._value()
+            if self._expect(',]') == ']':
+                return
+
+    def documents(self):
+        """Generator of `(meta, records)` tuples, one per document. Records are
+        a generator that has to be consumed before moving to the next
+        document.
+
+        Records are only streamed when `meta` comes first in the document
+        (which is always the case for documents written by influxdump),
+        otherwise they are loaded in memory.
+        """
+        while self._peek() != '':
+            header = {}
+            records = iter([])
+            self._expect('{')
+            if self._peek() == '}':
+                self._pos += 1
+                continue
+
+            while True:
+                key = self._value()
+                self._expect(':')
+                if key == "records" and "meta" in header:
+                    records = self._array()
+                    yield (header["meta"], records)
+                    # make sure the document has been read entirely
+                    for _ in records:
+                        pass
+                    records = None
+                elif key == "records":
+                    records = iter(list(self._array()))
+                else:
+                    header[key] = self._value()
+
+                if self._expect(',}') == '}':
+                    break
+
+            if records is not None:
+                yield (header.get("meta"), records)
+
+
+def read_documents(fd, bufsize=65536):
+    """Iterate over `(meta, records)` of the chunk documents of a file, see
+    `DocumentReader.documents`.
+    """
+    return DocumentReader(fd, bufsize).documents()
@@ -43,8 +43,11 @@ setup(
     keywords='influxdb',
     packages=find_packages(exclude=['contrib', 'docs', 'test*']),
     install_requires=requirements,
-    extra_require={
+    extras_require={
         'dev': requirements_dev,
+        'zstd': ['zstandard'],
+        'lz4': ['lz4'],
+        'numpy': ['numpy'],
     },
     entry_points={
         'console_scripts': [
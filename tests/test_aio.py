@@ -0,0 +1,313 @@
+# -*- coding: utf-8 -*-
+from concurrent.futures import ThreadPoolExecutor
+import gzip
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from urllib.parse import parse_qs, urlparse
+
+from influxdb.exceptions import InfluxDBClientError
+import msgpack
+from requests.exceptions import ReadTimeout, RequestException
+
+from influxdump.aio import AioInfluxDBClient
+from influxdump.data import copy_data, dump_data, load_folder
+from influxdump.db import InfluxDBClient
+
+
+def series(measurement, columns, values):
+    return {"name": measurement, "columns": columns, "values": values}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def send(self, status, body=b'', headers={}):
+        if body and "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body)
+            headers = dict(headers, **{"Content-Encoding": "gzip"})
+        self.send_response(status)
+        for (name, value) in headers.items():
+            self.send_header(name, value)
+        if status != 204:
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {k: v[0] for (k, v) in parse_qs(url.query).items()}
+        self.server.requests.append(params["q"])
+        if params["q"] == "SLEEP":
+            time.sleep(0.5)
+            return self.send(200, b'{"results": []}')
+        try:
+            results = [self.server.run(q) for q in params["q"].split(";")]
+        except KeyError as e:
+            body = json.dumps({"error": "unknown {}".format(e)})
+            return self.send(400, body.encode('utf-8'))
+
+        if params.get("chunked") != "true":
+            data = {"results": [
+                {"statement_id": i, "series": s} if s else {"statement_id": i}
+                for (i, s) in enumerate(results)
+            ]}
+            if self.headers["Accept"] == "application/x-msgpack":
+                self.server.msgpack += 1
+                return self.send(200, msgpack.packb(data),
+                        {"Content-Type": "application/x-msgpack"})
+            return self.send(200, json.dumps(data).encode('utf-8'),
+                    {"Content-Type": "application/json"})
+
+        size = int(params.get("chunk_size", 10000))
+        self.send_response(200)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for s in results[0]:
+            for i in range(0, len(s["values"]), size):
+                chunk = dict(s, values=s["values"][i:i + size])
+                line = json.dumps({"results": [
+                    {"statement_id": 0, "series": [chunk]}]}) + "\n"
+                data = line.encode('utf-8')
+                self.wfile.write("{:x}\r\n".format(len(data)).encode('ascii'))
+                self.wfile.write(data + b"\r\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        params = {k: v[0] for (k, v) in parse_qs(url.query).items()}
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        self.server.requests.append("write {}".format(
+            params.get("precision")))
+        with self.server.lock:
+            self.server.written.extend(body.decode('utf-8').splitlines())
+        self.send(204)
+
+
+class StubServer(ThreadingHTTPServer):
+    """Minimal influxdb http api serving `(time, value)` records of
+    measurements and recording written lines.
+    """
+    daemon_threads = True
+
+    def __init__(self, data):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.data = data
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.msgpack = 0
+        self.requests = []
+        self.written = []
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def run(self, q):
+        if q == "SHOW MEASUREMENTS":
+            return [series("measurements", ["name"],
+                [[m] for m in sorted(self.data)])]
+        measurement = re.search(r'FROM "([^"]+)"', q).group(1)
+        records = self.data[measurement]
+        if q.startswith("SHOW FIELD KEYS"):
+            return [series(measurement, ["fieldKey", "fieldType"],
+                [["value", "float"]])]
+        if q.startswith("SHOW TAG KEYS"):
+            return []
+        if "COUNT(*)" in q:
+            if not records:
+                return []
+            return [series(measurement, ["time", "count_value"],
+                [["1970-01-01T00:00:00Z", len(records)]])]
+        limit = re.search(r"LIMIT (\d+)", q)
+        if limit is not None:
+            records = records[:int(limit.group(1))]
+        if not records:
+            return []
+        return [series(measurement, ["time", "value"],
+            [list(r) for r in records])]
+
+
+class TestAioClient(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer({
+            "cpu": [("2020-01-01T00:00:{:02d}Z".format(i), float(i))
+                for i in range(25)],
+            "mem": [("2020-01-01T00:00:00Z", 1.0)],
+        })
+        self.client = AioInfluxDBClient("127.0.0.1", self.server.port, "",
+                "", "db", pool_size=4)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+
+    def test_query(self):
+        self.assertEqual(self.client.get_measurements(), ["cpu", "mem"])
+        res = self.client.query('SELECT * FROM "mem"')
+        self.assertEqual(list(self.client.get_points(res)),
+                [{"time": "2020-01-01T00:00:00Z", "value": 1.0}])
+
+        res = self.client.query('SELECT * FROM "mem";SELECT * FROM "cpu"')
+        self.assertEqual([len(list(r.get_points())) for r in res], [1, 25])
+
+        with self.assertRaises(InfluxDBClientError):
+            self.client.query('SELECT * FROM "unknown"')
+
+    def test_query_chunked(self):
+        chunks = self.client.query('SELECT * FROM "cpu"', chunked=True,
+                chunk_size=10)
+        self.assertEqual([len(list(r.get_points())) for r in chunks],
+                [10, 10, 5])
+
+        # an abandoned response does not break the pool
+        chunks = self.client.query('SELECT * FROM "cpu"', chunked=True,
+                chunk_size=10)
+        next(chunks)
+        chunks.close()
+        res = self.client.query('SELECT * FROM "mem"')
+        self.assertEqual(len(list(res.get_points())), 1)
+
+    def test_write_points(self):
+        self.client.write_points([{
+            "measurement": "cpu",
+            "time": 1,
+            "fields": {"value": 1.0},
+        }])
+        self.client.write_points(["cpu value=2.0 2"], protocol='line',
+                time_precision='n')
+        self.assertEqual(self.server.written,
+                ["cpu value=1.0 1", "cpu value=2.0 2"])
+        self.assertEqual(self.server.requests, ["write None", "write n"])
+
+    def test_pool(self):
+        def query(_):
+            res = self.client.clone().query('SELECT * FROM "cpu"')
+            return len(list(res.get_points()))
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            counts = list(executor.map(query, range(40)))
+        self.assertEqual(counts, [25] * 40)
+        # connections are kept alive and shared by all threads
+        self.assertLessEqual(self.server.connections, 4)
+
+    def test_connection_error(self):
+        self.server.stop()
+        with self.assertRaises(RequestException):
+            self.client.query('SELECT * FROM "mem"')
+
+    def test_dump_load(self):
+        folder = tempfile.mkdtemp()
+        try:
+            dump_data(self.client, folder=folder, chunk_size=10, jobs=2,
+                    fmt='lp')
+            self.assertEqual(sorted(os.listdir(os.path.join(folder, "cpu"))),
+                    ["cpu-00001.lp", "cpu-00001.meta", "cpu-00002.lp",
+                        "cpu-00002.meta", "cpu-00003.lp", "cpu-00003.meta"])
+
+            load_folder(self.client, folder, jobs=2)
+            self.assertEqual(len(self.server.written), 26)
+        finally:
+            shutil.rmtree(folder)
+
+
+class TestHTTPOptions(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer({
+            "cpu": [("2020-01-01T00:00:{:02d}Z".format(i), float(i))
+                for i in range(25)],
+        })
+
+    def tearDown(self):
+        self.server.stop()
+
+    def check(self, client):
+        res = client.query('SELECT * FROM "cpu"')
+        self.assertEqual(len(list(client.get_points(res))), 25)
+        chunks = client.query('SELECT * FROM "cpu"', chunked=True,
+                chunk_size=10)
+        self.assertEqual([len(list(r.get_points())) for r in chunks],
+                [10, 10, 5])
+        client.write_points(["cpu value=1.0 1"], protocol='line')
+        self.assertEqual(self.server.written, ["cpu value=1.0 1"])
+
+    def test_requests_backend(self):
+        self.check(InfluxDBClient("127.0.0.1", self.server.port, "", "",
+            "db", gzip=True, msgpack=True, pool_size=2, timeout=(1, 1)))
+        self.assertEqual(self.server.msgpack, 1)
+
+    def test_asyncio_backend(self):
+        client = AioInfluxDBClient("127.0.0.1", self.server.port, "", "",
+                "db", gzip=True, msgpack=True, pool_size=2, timeout=(1, 1))
+        try:
+            self.check(client)
+        finally:
+            client.close()
+        self.assertEqual(self.server.msgpack, 1)
+
+    def test_timeout(self):
+        for cls in (InfluxDBClient, AioInfluxDBClient):
+            client = cls("127.0.0.1", self.server.port, "", "", "db",
+                    timeout=(1, 0.1))
+            with self.assertRaises(ReadTimeout):
+                client.query("SLEEP")
+            if cls is AioInfluxDBClient:
+                client.close()
+
+
+class TestCopy(unittest.TestCase):
+    def setUp(self):
+        self.src = StubServer({
+            "cpu": [("2020-01-01T00:00:{:02d}Z".format(i), float(i))
+                for i in range(25)],
+            "mem": [("2020-01-01T00:00:00Z", 1.0)],
+            "empty": [],
+        })
+        self.dst = StubServer({})
+
+    def tearDown(self):
+        self.src.stop()
+        self.dst.stop()
+
+    def test_copy(self):
+        for cls in (InfluxDBClient, AioInfluxDBClient):
+            src = cls("127.0.0.1", self.src.port, "", "", "db")
+            dst = cls("127.0.0.1", self.dst.port, "", "", "db")
+            try:
+                copy_data(src, dst, chunk_size=10, jobs=2, typecast=True,
+                        protocol='line')
+            finally:
+                if cls is AioInfluxDBClient:
+                    src.close()
+                    dst.close()
+
+            self.assertEqual(sorted(self.dst.written), sorted(
+                ["cpu value={} {}".format(float(i), 1577836800 + i) + "0" * 9
+                    for i in range(25)]
+                + ["mem value=1.0 1577836800000000000"]))
+            # points are read by chunks from the source only
+            self.assertEqual(self.src.written, [])
+            del self.dst.written[:]
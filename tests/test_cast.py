@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from influxdump import cast as castmod
+from influxdump.cast import cast_column, cast_records, compile_cast
+from influxdump.db import data_to_points
+
+
+class TestCast(unittest.TestCase):
+    def test_compile_cast(self):
+        self.assertEqual(compile_cast({}, ["time", "a"]), [])
+        self.assertEqual(
+                compile_cast({"a": "float", "*": "str"}, ["time", "a", "b", "t"],
+                    tags=("t",)),
+                [("a", float), ("b", str)])
+        self.assertEqual(compile_cast({"a": "int"}, ["a", "b"]), [("a", int)])
+
+    def test_cast_records(self):
+        records = [
+            {"time": 1, "a": 1, "b": "2"},
+            {"time": 2, "a": None, "b": "3"},
+        ]
+        cast_records(records, compile_cast({"a": "float", "b": "int"},
+            records[0]))
+        self.assertEqual(records, [
+            {"time": 1, "a": 1.0, "b": 2},
+            {"time": 2, "a": None, "b": 3},
+        ])
+        self.assertIsInstance(records[0]["a"], float)
+
+    def test_cast_column(self):
+        column = list(range(100)) + [True, 2.5]
+        for vector in (True, False):
+            numpy = castmod.numpy
+            if not vector:
+                castmod.numpy = None
+            try:
+                floats = cast_column(column, float)
+                ints = cast_column(column, int)
+            finally:
+                castmod.numpy = numpy
+            self.assertEqual([type(v) for v in floats], [float] * 102)
+            self.assertEqual(floats, [float(v) for v in column])
+            self.assertEqual(ints, [int(v) for v in column])
+        self.assertEqual(cast_column([1, None, "2"], int), [1, None, 2])
+        self.assertEqual(cast_column([1 << 70] * 100, float),
+                [float(1 << 70)] * 100)
+        self.assertEqual(cast_column([(1 << 63) + 5] * 100, int),
+                [(1 << 63) + 5] * 100)
+
+    def test_data_to_points(self):
+        records = [
+            {"time": "t1", "a": 1, "b": None, "host": "h"},
+            {"time": "t2", "a": None, "b": None, "host": "h"},
+        ]
+        self.assertEqual(
+                data_to_points("m", records, cast={"*": "float"},
+                    tags=("host",)),
+                [{
+                    "measurement": "m",
+                    "time": "t1",
+                    "fields": {"a": 1.0},
+                    "tags": {"host": "h"},
+                }])
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+import io
+import unittest
+
+from influxdump.columnar import (
+    cast_columns,
+    iter_records,
+    read_columns,
+    write_columns,
+)
+
+
+class TestColumnar(unittest.TestCase):
+    def test_roundtrip(self):
+        records = [
+            {"time": "1970-01-01T00:00:01Z", "f": 1, "i": 1, "s": "é",
+                "b": True, "m": 1},
+            {"time": "1970-01-01T00:00:02Z", "f": 2.5, "i": None, "s": None,
+                "b": False, "m": "x"},
+            {"time": "1970-01-01T00:00:03Z", "f": None, "i": 3, "s": "",
+                "b": None, "m": None, "new": 1},
+        ]
+        meta = {"measurement": "m", "types": {"f": "float"}}
+        fd = io.BytesIO()
+        self.assertEqual(write_columns(fd, meta, records), 3)
+        fd.seek(0)
+        (_meta, times, columns) = read_columns(fd)
+        self.assertEqual(_meta, meta)
+        self.assertEqual(times, [10 ** 9, 2 * 10 ** 9, 3 * 10 ** 9])
+        self.assertEqual(columns, {
+            "f": [1.0, 2.5, None],
+            "i": [1, None, 3],
+            "s": ["é", None, ""],
+            "b": [True, False, None],
+            "m": [1, "x", None],
+            "new": [None, None, 1],
+        })
+        self.assertIsInstance(columns["f"][0], float)
+        self.assertEqual(next(iter_records(times, columns)), {
+            "time": 10 ** 9, "f": 1.0, "i": 1, "s": "é", "b": True, "m": 1,
+            "new": None,
+        })
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            read_columns(io.BytesIO(b'{"meta": {}}'))
+
+    def test_cast_columns(self):
+        self.assertEqual(
+                cast_columns({"a": [1, None], "b": [2]}, {"*": "float"}),
+                {"a": [1.0, None], "b": [2.0]}
+        )
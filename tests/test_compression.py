@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+from influxdump.compression import get_codec, open_file, parse_compression
+from influxdump.exceptions import CompressionError
+
+
+class TestCompression(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_parse_compression(self):
+        self.assertEqual(parse_compression("gzip"), ("gzip", None))
+        self.assertEqual(parse_compression("zstd:10"), ("zstd", 10))
+        with self.assertRaises(ValueError):
+            parse_compression("bzip2")
+
+    def test_threaded_gzip(self):
+        path = os.path.join(self.folder, "data.json.gz")
+        self.assertEqual(get_codec(path), "gzip")
+        lines = ["line {}\n".format(i) for i in range(1000)]
+        with open_file(path, "w", "gzip", 1) as fd:
+            for line in lines:
+                fd.write(line)
+
+        with gzip.open(path, "rt") as fd:
+            self.assertEqual(fd.readlines(), lines)
+        with open_file(path, "r") as fd:
+            self.assertEqual(fd.readlines(), lines)
+
+    def test_utf8(self):
+        line = 'cpu,host=\u00e9t\u00e9 value="\u00fc" 1\n'
+        for codec in (None, "gzip"):
+            path = os.path.join(self.folder, "data.lp")
+            if codec is not None:
+                path += ".gz"
+            with open_file(path, "w", codec) as fd:
+                fd.write(line)
+            # plain and compressed files have the same contents
+            with open_file(path, "rb") as fd:
+                self.assertEqual(fd.read(), line.encode('utf-8'))
+            with open_file(path, "r") as fd:
+                self.assertEqual(fd.read(), line)
+
+    def test_missing_codec(self):
+        try:
+            import zstandard
+        except ImportError:
+            with self.assertRaises(CompressionError):
+                open_file(os.path.join(self.folder, "data.json.zst"), "w",
+                        "zstd")
+        else:
+            self.skipTest("zstandard is installed")
@@ -0,0 +1,714 @@
+# -*- coding: utf-8 -*-
+from datetime import timedelta
+import gzip
+import json
+import operator
+import os
+import re
+import shutil
+import tempfile
+import unittest
+
+from influxdb.resultset import ResultSet
+from requests.exceptions import RequestException
+
+from influxdump.data import (
+    BATCHSIZE,
+    PROBES,
+    copy_data,
+    dump_data,
+    group_chunks,
+    list_chunks,
+    list_files,
+    load_file,
+    load_folder,
+    read_meta,
+    run_processes,
+    write_meta,
+)
+from influxdump.catalogue import CATALOGUE, Catalogue, checksum
+from influxdump.db import SchemaCache
+from influxdump.exceptions import RecastError
+from influxdump.journal import JOURNAL
+from influxdump.lineprotocol import rfc3339_to_ns
+from influxdump.manifest import MANIFEST
+from influxdump.sizing import MIN_SIZE
+
+
+OPS = {
+    ">=": operator.ge,
+    ">": operator.gt,
+    "<=": operator.le,
+    "<": operator.lt,
+}
+
+
+def resultset(measurement, columns, values):
+    return ResultSet({"series": [{
+        "name": measurement,
+        "columns": columns,
+        "values": values,
+    }]})
+
+
+def schema_resultset(measurements, columns, values):
+    return ResultSet({"series": [{
+        "name": m,
+        "columns": columns,
+        "values": values(m),
+    } for m in measurements]})
+
+
+class FakeClient(object):
+    """In-memory stand-in for `influxdump.db.InfluxDBClient`, records are
+    lists of `(time, value, *tag values)` tuples per measurement.
+    """
+    has_tags = True
+
+    def __init__(self, data, tags={}, schema=None):
+        self.data = data
+        self.tags = tags
+        self.schema = schema or SchemaCache()
+        self.queries = []
+        self.written = []
+        # measurement -> offset of the record at which the stream breaks
+        self.failures = {}
+
+    def clone(self):
+        client = FakeClient(self.data, self.tags, self.schema)
+        client.queries = self.queries
+        client.written = self.written
+        return client
+
+    def get_measurements(self, pattern=None):
+        return [m for m in sorted(self.data)
+                if pattern is None or re.search(pattern, m)]
+
+    def get_points(self, res):
+        for point in res.get_points():
+            yield point
+
+    def write_points(self, points, **kwargs):
+        self.written.append(points)
+
+    def query(self, q, chunked=False, chunk_size=0):
+        if ";" in q:
+            return [self.query(statement) for statement in q.split(";")]
+        self.queries.append(q)
+        if q == "SHOW SERIES EXACT CARDINALITY":
+            return schema_resultset(
+                    [m for m in sorted(self.data) if self.data[m]],
+                    ["count"], lambda m: [[1]])
+        if q.startswith("SHOW"):
+            measurements = re.findall(r'"([^"]+)"', q)
+            if q.startswith("SHOW TAG KEYS"):
+                return schema_resultset(measurements, ["tagKey"],
+                        lambda m: [[tag] for tag in self.tags.get(m, [])])
+            return schema_resultset(measurements, ["fieldKey", "fieldType"],
+                    lambda m: [["value", "float"]])
+
+        measurement = re.search(r'FROM "([^"]+)"', q).group(1)
+        records = self.data.get(measurement, [])
+        for (op, value) in re.findall(r"time ([<>]=?) '([^']+)'", q):
+            records = [r for r in records if OPS[op](r[0], value)]
+        if "ORDER BY time DESC" in q:
+            records = records[::-1]
+        limit = re.search(r"LIMIT (\d+)", q)
+        if limit is not None:
+            records = records[:int(limit.group(1))]
+        columns = ["time", "value"] + self.tags.get(measurement, [])
+        if "COUNT(*)" in q:
+            if not records:
+                return ResultSet({})
+            return resultset(measurement, ["time", "count_value"],
+                    [["1970-01-01T00:00:00Z", len(records)]])
+
+        if not chunked:
+            return resultset(measurement, columns,
+                    [list(r) for r in records])
+        size = chunk_size or len(records)
+        return self.chunks(measurement, columns, records, size)
+
+    def chunks(self, measurement, columns, records, size):
+        for i in range(0, len(records), size):
+            if self.failures.get(measurement) == i:
+                del self.failures[measurement]
+                raise RequestException("connection lost")
+            yield resultset(measurement, columns,
+                    [list(r) for r in records[i:i + size]])
+
+
+class TestDumpData(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.client = FakeClient({
+            "cpu": [("2020-01-01T00:00:0{}Z".format(i), float(i))
+                for i in range(5)],
+            "mem": [("2020-01-01T00:00:00Z", 1.0)],
+            "empty": [],
+        })
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def list_folder(self):
+        return sorted(name for (_, _, files) in os.walk(self.folder)
+                for name in files if name not in (MANIFEST, CATALOGUE))
+
+    def read_folder(self):
+        chunks = {}
+        for root, _, files in os.walk(self.folder):
+            for name in files:
+                if name in (MANIFEST, CATALOGUE):
+                    continue
+                with open(os.path.join(root, name)) as fd:
+                    chunks[name] = json.load(fd)
+        return chunks
+
+    def test_dump_folder(self):
+        dump_data(self.client, folder=self.folder, chunk_size=2)
+        chunks = self.read_folder()
+        self.assertEqual(sorted(chunks), [
+            "cpu-00001.json", "cpu-00002.json", "cpu-00003.json",
+            "mem-00001.json",
+        ])
+        self.assertEqual(chunks["cpu-00003.json"]["meta"]["chunk_count"], 3)
+        self.assertEqual(len(chunks["cpu-00003.json"]["records"]), 1)
+
+    def test_dump_parallel_is_deterministic(self):
+        dump_data(self.client, folder=self.folder, chunk_size=2)
+        sequential = self.read_folder()
+        shutil.rmtree(self.folder)
+        os.makedirs(self.folder)
+
+        dump_data(self.client, folder=self.folder, chunk_size=2, jobs=3)
+        self.assertEqual(self.read_folder(), sequential)
+
+    def test_dump_sharded(self):
+        dump_data(self.client, folder=self.folder, chunk_size=2,
+                shard_width=timedelta(seconds=2))
+        chunks = self.read_folder()
+        self.assertEqual(sorted(chunks), [
+            "cpu-00001-00001.json", "cpu-00002-00001.json",
+            "cpu-00002-00002.json", "mem-00001.json",
+        ])
+        times = [r["time"] for name in sorted(chunks)
+                for r in chunks[name]["records"] if name.startswith("cpu")]
+        self.assertEqual(times, [r[0] for r in self.client.data["cpu"]])
+        self.assertEqual(chunks["cpu-00001-00001.json"]["meta"]["context"], {
+            "start": "",
+            "end": "2020-01-01T00:00:02Z",
+            "exclusive_end": True,
+            "shard": 1,
+            "shards": 2,
+        })
+
+    def test_dump_sharded_by_count(self):
+        dump_data(self.client, folder=self.folder, chunk_size=10,
+                shard_size=2, jobs=2)
+        chunks = self.read_folder()
+        self.assertEqual(sorted(chunks), [
+            "cpu-00001-00001.json", "cpu-00002-00001.json",
+            "cpu-00003-00001.json", "mem-00001.json",
+        ])
+
+    def test_dump_sharded_counts_once(self):
+        # the count sizing shards is the one probing unsharded queries
+        dump_data(self.client, folder=self.folder, chunk_size=10,
+                shard_size=10)
+        counts = [q for q in self.client.queries if "COUNT(*)" in q]
+        self.assertEqual(len(counts), 3)
+        self.assertEqual(sorted(self.read_folder()),
+                ["cpu-00001.json", "mem-00001.json"])
+
+    def test_dump_line_protocol(self):
+        dump_data(self.client, folder=self.folder, chunk_size=3, fmt='lp',
+                compress='gzip')
+        self.assertEqual(self.list_folder(), [
+            "cpu-00001.lp.gz", "cpu-00001.meta",
+            "cpu-00002.lp.gz", "cpu-00002.meta",
+            "mem-00001.lp.gz", "mem-00001.meta",
+        ])
+        with gzip.open(os.path.join(self.folder, "cpu", "cpu-00002.lp.gz"),
+                "rt") as fd:
+            self.assertEqual(fd.read(),
+                    "cpu value=3.0 1577836803000000000\n"
+                    "cpu value=4.0 1577836804000000000\n")
+        with open(os.path.join(self.folder, "cpu", "cpu-00002.meta")) as fd:
+            self.assertEqual(json.load(fd)["types"], {"value": "float"})
+
+        client = FakeClient({})
+        load_folder(client, self.folder, pattern="cpu")
+        self.assertEqual(len(client.written), 2)
+        self.assertEqual(client.written[1], [
+            "cpu value=3.0 1577836803000000000",
+            "cpu value=4.0 1577836804000000000",
+        ])
+
+    def test_dump_columnar(self):
+        dump_data(self.client, folder=self.folder, chunk_size=3, fmt='col')
+        self.assertEqual(self.list_folder(),
+                ["cpu-00001.col", "cpu-00002.col", "mem-00001.col"])
+
+        client = FakeClient({})
+        load_folder(client, self.folder, pattern="cpu", protocol='line')
+        self.assertEqual(client.written[1], [
+            "cpu value=3.0 1577836803000000000",
+            "cpu value=4.0 1577836804000000000",
+        ])
+
+    def test_dump_retry(self):
+        self.client.failures["cpu"] = 4
+        dump_data(self.client, folder=self.folder, chunk_size=2, retry=1)
+        chunks = self.read_folder()
+        self.assertEqual(sorted(chunks), [
+            "cpu-00001.json", "cpu-00002.json", "cpu-00003.json",
+            "mem-00001.json",
+        ])
+        # restarted from the last record of the second chunk
+        self.assertEqual(
+                [r["time"][-3:-1] for r in chunks["cpu-00003.json"]["records"]],
+                ["03", "04"]
+        )
+
+    def test_dump_resume(self):
+        self.client.failures["cpu"] = 4
+        with self.assertRaises(RequestException):
+            dump_data(self.client, folder=self.folder, chunk_size=2)
+        self.assertEqual(self.list_folder(),
+                ["cpu-00001.json", "cpu-00002.json"])
+
+        client = FakeClient(self.client.data)
+        dump_data(client, folder=self.folder, chunk_size=2, resume=True)
+        chunks = self.read_folder()
+        self.assertEqual(sorted(chunks), [
+            "cpu-00001.json", "cpu-00002.json", "cpu-00003.json",
+            "mem-00001.json",
+        ])
+        self.assertEqual(
+                chunks["cpu-00003.json"]["meta"]["context"]["start"],
+                "2020-01-01T00:00:03Z"
+        )
+
+        # everything is complete, nothing left to query
+        client = FakeClient(self.client.data)
+        dump_data(client, folder=self.folder, chunk_size=2, resume=True)
+        self.assertEqual(client.queries, [])
+
+    def test_dump_incremental(self):
+        dump_data(self.client, folder=self.folder, incremental=True)
+        self.client.data["cpu"].append(("2020-01-01T00:00:05Z", 5.0))
+        self.client.data["empty"].append(("2020-01-01T00:00:00Z", 0.0))
+        dump_data(self.client, folder=self.folder, incremental=True)
+
+        gen1 = os.path.join(self.folder, "gen-00001")
+        self.assertEqual(sorted(os.listdir(gen1)),
+                ["catalogue.json", "cpu", "empty", "manifest.jsonl"])
+        with open(os.path.join(gen1, "cpu", "cpu-00001.json")) as fd:
+            data = json.load(fd)
+        self.assertEqual(data["records"],
+                [{"time": "2020-01-01T00:00:05Z", "value": 5.0}])
+        self.assertEqual(data["meta"]["context"]["exclusive_start"], True)
+
+        client = FakeClient({})
+        load_folder(client, self.folder)
+        times = [(p["measurement"], p["time"][-3:-1])
+                for batch in client.written for p in batch]
+        self.assertEqual(times, [
+            ("cpu", "00"), ("cpu", "01"), ("cpu", "02"), ("cpu", "03"),
+            ("cpu", "04"), ("mem", "00"), ("cpu", "05"), ("empty", "00"),
+        ])
+
+    def test_dump_incremental_sharded(self):
+        self.client.data["cpu"] = [
+            ("2020-01-01T00:00:0{}Z".format(i), float(i)) for i in range(3)]
+        dump_data(self.client, folder=self.folder, incremental=True)
+        self.client.data["cpu"].extend(
+            ("2020-01-01T00:00:0{}Z".format(i), float(i)) for i in range(3, 9))
+        dump_data(self.client, folder=self.folder, incremental=True,
+                shard_width=timedelta(seconds=2))
+
+        client = FakeClient({})
+        load_folder(client, self.folder, pattern="cpu")
+        times = [p["time"][-3:-1] for batch in client.written for p in batch]
+        self.assertEqual(times, ["0{}".format(i) for i in range(9)])
+
+    def test_dump_tags(self):
+        client = FakeClient({
+            "cpu": [
+                ("2020-01-01T00:00:00Z", 1.0, "b"),
+                ("2020-01-01T00:00:01Z", 2.0, "a"),
+                ("2020-01-01T00:00:02Z", 3.0, "b"),
+            ],
+        }, tags={"cpu": ["host"]})
+        expected = [
+            {"measurement": "cpu", "time": "2020-01-01T00:00:01Z",
+                "fields": {"value": 2.0}, "tags": {"host": "a"}},
+            {"measurement": "cpu", "time": "2020-01-01T00:00:00Z",
+                "fields": {"value": 1.0}, "tags": {"host": "b"}},
+            {"measurement": "cpu", "time": "2020-01-01T00:00:02Z",
+                "fields": {"value": 3.0}, "tags": {"host": "b"}},
+        ]
+        for fmt in ("json", "col"):
+            dump_data(client, folder=self.folder, fmt=fmt)
+            [datafile] = list_files(self.folder)
+            self.assertEqual(read_meta(datafile)["tags"], ["host"])
+
+            loaded = FakeClient({})
+            load_folder(loaded, self.folder)
+            # points are sorted by series, columnar times are in nanoseconds
+            for point in loaded.written[0]:
+                point["time"] = rfc3339_to_ns(point["time"])
+            self.assertEqual(loaded.written, [[dict(point,
+                time=rfc3339_to_ns(point["time"])) for point in expected]])
+            shutil.rmtree(os.path.join(self.folder, "cpu"))
+
+        dump_data(client, folder=self.folder, fmt='lp')
+        with open(os.path.join(self.folder, "cpu", "cpu-00001.lp")) as fd:
+            self.assertEqual(fd.readline(),
+                    "cpu,host=b value=1.0 1577836800000000000\n")
+
+    def test_dump_bulk_discovery(self):
+        dump_data(self.client, folder=self.folder, typecast=True)
+        schema = [q for q in self.client.queries if q.startswith("SHOW")]
+        self.assertEqual(schema, [
+            'SHOW FIELD KEYS FROM "cpu", "empty", "mem"',
+            'SHOW TAG KEYS FROM "cpu", "empty", "mem"',
+        ])
+        self.assertEqual(self.read_folder()["mem-00001.json"]["meta"]["types"],
+                {"value": "float"})
+
+    def test_dump_probes(self):
+        for probe in PROBES:
+            client = FakeClient(self.client.data)
+            dump_data(client, folder=self.folder, chunk_size=2, probe=probe)
+            self.assertEqual(self.list_folder(), [
+                "cpu-00001.json", "cpu-00002.json", "cpu-00003.json",
+                "mem-00001.json",
+            ])
+            probes = [q for q in client.queries
+                    if "COUNT" in q or q.endswith("LIMIT 1")
+                    or "CARDINALITY" in q]
+            self.assertEqual(len(probes), 1 if probe == 'cardinality' else 3)
+            shutil.rmtree(self.folder)
+            os.mkdir(self.folder)
+
+    def test_dump_batch_small(self):
+        dump_data(self.client, folder=self.folder, chunk_size=2,
+                batch_small=2)
+        chunks = self.read_folder()
+        self.assertEqual(sorted(chunks), [
+            "cpu-00001.json", "cpu-00002.json", "cpu-00003.json",
+            "mem-00001.json",
+        ])
+        self.assertEqual(chunks["mem-00001.json"]["records"],
+                [{"time": "2020-01-01T00:00:00Z", "value": 1.0}])
+        # only the large measurement is probed and dumped by itself
+        self.assertEqual([q for q in self.client.queries if "COUNT" in q],
+                ['SELECT COUNT(*) FROM "cpu"'])
+
+        client = FakeClient(self.client.data)
+        dump_data(client, folder=self.folder, resume=True, batch_small=2)
+        self.assertEqual(client.queries, [])
+
+    def test_dump_adaptive(self):
+        # the first chunk of a measurement has the initial size, the query is
+        # restarted from its last record with the adapted size
+        dump_data(self.client, folder=self.folder, chunk_size=2,
+                adaptive=True, memory_budget=1)
+        chunks = self.read_folder()
+        self.assertEqual(sorted(chunks), [
+            "cpu-00001.json", "cpu-00002.json", "mem-00001.json",
+        ])
+        self.assertEqual(
+                [r["time"][-3:-1] for r in chunks["cpu-00001.json"]["records"]],
+                ["00", "01"])
+        self.assertEqual(
+                [r["time"][-3:-1] for r in chunks["cpu-00002.json"]["records"]],
+                ["01", "02", "03", "04"])
+        self.assertIn(
+                "SELECT * FROM \"cpu\" WHERE time >= '2020-01-01T00:00:01Z'",
+                self.client.queries)
+
+    def test_copy(self):
+        dst = FakeClient({})
+        copy_data(self.client, dst, chunk_size=2, jobs=2, typecast=True,
+                cast={"value": "int"})
+        points = sorted((p["measurement"], p["time"], p["fields"]["value"])
+                for batch in dst.written for p in batch)
+        self.assertEqual(set(type(p[2]) for p in points), set([int]))
+        self.assertEqual(points, sorted((m, r[0], int(r[1]))
+                for m in self.client.data for r in self.client.data[m]))
+        # nothing is written to the source
+        self.assertEqual(self.client.written, [])
+
+    def test_catalogue_checksum(self):
+        # sizes and checksums are computed while chunks are written
+        for (fmt, compress) in (("json", None), ("json", "gzip"),
+                ("lp", None), ("lp", "gzip"), ("col", None), ("col", "gzip")):
+            dump_data(self.client, folder=self.folder, chunk_size=2,
+                    fmt=fmt, compress=compress)
+            catalogue = Catalogue(self.folder).load()
+            self.assertEqual(len(catalogue.chunks), 4)
+            for chunk in catalogue.chunks.values():
+                datafile = os.path.join(self.folder, chunk["file"])
+                self.assertEqual(
+                        (chunk["size"], chunk["checksum"]),
+                        (os.path.getsize(datafile), checksum(datafile)))
+            shutil.rmtree(self.folder)
+            os.makedirs(self.folder)
+
+    def test_copy_dryrun(self):
+        dst = FakeClient({})
+        copy_data(self.client, dst, dryrun=True)
+        self.assertEqual(dst.written, [])
+        self.assertEqual(dst.queries, [])
+        # measurements are listed without querying their data
+        self.assertFalse([q for q in self.client.queries
+                if q.startswith("SELECT")])
+
+    def test_meta(self):
+        for (fmt, compress) in (("json", "gzip"), ("lp", None), ("col", None)):
+            dump_data(self.client, folder=self.folder, pattern="mem",
+                    fmt=fmt, compress=compress, typecast=True)
+            [datafile] = list_files(self.folder)
+            meta = read_meta(datafile)
+            self.assertEqual(meta["types"], {"value": "float"})
+
+            with open(datafile, "rb") as fd:
+                payload = fd.read()
+            meta["types"] = {"value": "int"}
+            if fmt == "lp":
+                # values are encoded in lines with the dumped types
+                self.assertRaises(RecastError, write_meta, datafile, meta)
+                self.assertEqual(read_meta(datafile)["types"],
+                        {"value": "float"})
+            else:
+                write_meta(datafile, meta)
+                self.assertEqual(read_meta(datafile)["types"],
+                        {"value": "int"})
+            # records are not rewritten
+            with open(datafile, "rb") as fd:
+                self.assertEqual(fd.read(), payload)
+
+            if fmt != "lp":
+                client = FakeClient({})
+                load_folder(client, self.folder, typecast=True)
+                [[point]] = client.written
+                self.assertIs(type(point["fields"]["value"]), int)
+            shutil.rmtree(os.path.join(self.folder, "mem"))
+
+
+class TestLoadData(unittest.TestCase):
+    def setUp(self):
+        (fd, self.path) = tempfile.mkstemp()
+        with os.fdopen(fd, "w") as fh:
+            for i in range(2):
+                json.dump({
+                    "meta": {"measurement": "cpu", "types": {"value": "float"}},
+                    "records": [
+                        {"time": "2020-01-01T00:00:0{}Z".format(i), "value": 1},
+                        {"time": "2020-01-01T00:00:0{}Z".format(i),
+                            "value": None},
+                    ],
+                }, fh)
+                fh.write("\n")
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_load_file(self):
+        client = FakeClient({})
+        load_file(client, self.path, typecast=True)
+        self.assertEqual(client.written, [
+            [{
+                "measurement": "cpu",
+                "time": "2020-01-01T00:00:0{}Z".format(i),
+                "fields": {"value": 1.0},
+            }] for i in range(2)
+        ])
+        self.assertIsInstance(client.written[0][0]["fields"]["value"], float)
+
+    def test_load_file_line_protocol(self):
+        client = FakeClient({})
+        load_file(client, self.path, typecast=True, protocol='line')
+        self.assertEqual(client.written, [
+            ["cpu value=1.0 157783680{}000000000".format(i)] for i in range(2)
+        ])
+
+
+class TestLoadFolder(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.client = FakeClient({
+            m: [("2020-01-01T00:00:{:02d}Z".format(i), float(i))
+                for i in range(25)]
+            for m in ("cpu", "mem", "disk")
+        })
+        dump_data(self.client, folder=self.folder, chunk_size=10)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_load_parallel(self):
+        client = FakeClient({})
+        load_folder(client, self.folder, pattern="cpu|mem", jobs=3)
+        points = sorted((p["measurement"], p["time"])
+                for batch in client.written for p in batch)
+        self.assertEqual(points, sorted((m, r[0])
+                for m in ("cpu", "mem") for r in self.client.data[m]))
+
+    def test_load_parallel_error(self):
+        client = FakeClient({})
+
+        def write_points(points, **kwargs):
+            raise IOError("write failed")
+
+        client.clone = lambda: client
+        client.write_points = write_points
+        with self.assertRaises(IOError):
+            load_folder(client, self.folder, jobs=2)
+
+    def test_load_resume(self):
+        client = FakeClient({})
+        write_points = client.write_points
+
+        def failing_write_points(points, **kwargs):
+            if len(client.written) == 4:
+                raise IOError("write failed")
+            write_points(points, **kwargs)
+
+        client.write_points = failing_write_points
+        with self.assertRaises(IOError):
+            load_folder(client, self.folder, resume=True)
+        self.assertEqual(len(client.written), 4)
+
+        resumed = FakeClient({})
+        load_folder(resumed, self.folder, resume=True)
+        points = sorted((p["measurement"], p["time"])
+                for batch in client.written + resumed.written for p in batch)
+        self.assertEqual(points, sorted((m, r[0])
+                for m in self.client.data for r in self.client.data[m]))
+
+        # everything is loaded, nothing left to write
+        done = FakeClient({})
+        load_folder(done, self.folder, resume=True, jobs=2)
+        self.assertEqual(done.written, [])
+
+    def test_load_adaptive(self):
+        client = FakeClient({})
+        load_folder(client, self.folder, adaptive=True, memory_budget=1,
+                resume=True)
+        points = sorted((p["measurement"], p["time"])
+                for batch in client.written for p in batch)
+        self.assertEqual(points, sorted((m, r[0])
+                for m in self.client.data for r in self.client.data[m]))
+
+        # batch sizes are journaled so that resumed files keep their batches
+        with open(os.path.join(self.folder, JOURNAL)) as fd:
+            events = [json.loads(line) for line in fd]
+        sizes = set(e["batch_size"] for e in events if e["event"] == "file")
+        self.assertTrue(sizes)
+        self.assertTrue(sizes <= set([BATCHSIZE, MIN_SIZE]))
+
+    def test_catalogue(self):
+        with open(os.path.join(self.folder, CATALOGUE)) as fd:
+            chunks = json.load(fd)["chunks"]
+        self.assertEqual([c["file"] for c in chunks],
+                [os.path.relpath(f, self.folder)
+                    for f in list_files(self.folder)])
+        chunk = chunks[0]
+        self.assertEqual(chunk["file"], os.path.join("cpu", "cpu-00001.json"))
+        self.assertEqual(
+                (chunk["measurement"], chunk["records"], chunk["first"],
+                    chunk["last"]),
+                ("cpu", 10, "2020-01-01T00:00:00Z", "2020-01-01T00:00:09Z"))
+        datafile = os.path.join(self.folder, chunk["file"])
+        self.assertEqual(chunk["size"], os.path.getsize(datafile))
+        self.assertEqual(chunk["checksum"], checksum(datafile))
+        self.assertEqual(chunk["meta"], read_meta(datafile))
+
+        # folders without catalogue are scanned
+        files = list_files(self.folder)
+        os.remove(os.path.join(self.folder, CATALOGUE))
+        self.assertEqual(list_files(self.folder), files)
+
+    def test_group_chunks(self):
+        catalogued = group_chunks(list_chunks(self.folder))
+        os.remove(os.path.join(self.folder, CATALOGUE))
+        scanned = group_chunks(list_chunks(self.folder))
+        for groups in (catalogued, scanned):
+            self.assertEqual([(m, len(items)) for (m, items) in groups],
+                    [("cpu", 3), ("disk", 3), ("mem", 3)])
+        self.assertEqual(run_processes(len, [items for (_, items) in scanned],
+                jobs=2), [3, 3, 3])
+
+    def test_load_time_range(self):
+        # chunks out of the range are not opened
+        for datafile in list_files(self.folder, "disk"):
+            os.remove(datafile)
+        os.remove(list_files(self.folder, "cpu")[0])
+
+        client = FakeClient({})
+        load_folder(client, self.folder, pattern="cpu|mem",
+                start="2020-01-01T00:00:12Z", end="2020-01-01T00:00:21Z")
+        points = sorted((p["measurement"], p["time"])
+                for batch in client.written for p in batch)
+        self.assertEqual(points, sorted((m, r[0])
+                for m in ("cpu", "mem") for r in self.client.data[m][12:22]))
+
+    def test_catalogue_interrupted_dump(self):
+        client = FakeClient({
+            "cpu": [("2020-01-01T00:01:{:02d}Z".format(i), float(i))
+                for i in range(25)],
+        })
+        client.failures["cpu"] = 10
+        with self.assertRaises(RequestException):
+            dump_data(client, folder=self.folder, chunk_size=10)
+        # the catalogue of the previous dump does not list the new chunks
+        self.assertFalse(os.path.exists(
+            os.path.join(self.folder, CATALOGUE)))
+
+        loaded = FakeClient({})
+        load_folder(loaded, self.folder, start="2020-01-01T00:01:00Z")
+        self.assertEqual(sum(len(batch) for batch in loaded.written), 10)
+
+        dump_data(client, folder=self.folder, chunk_size=10, resume=True)
+        self.assertTrue(os.path.exists(os.path.join(self.folder, CATALOGUE)))
+        loaded = FakeClient({})
+        load_folder(loaded, self.folder, start="2020-01-01T00:01:00Z")
+        # the resumed query restarts at the time of its last record
+        self.assertEqual(set(p["time"] for batch in loaded.written
+                for p in batch), set(r[0] for r in client.data["cpu"]))
+
+    def test_load_without_journal(self):
+        # loads that are not resumable leave the folder untouched
+        load_folder(FakeClient({}), self.folder)
+        self.assertFalse(os.path.exists(os.path.join(self.folder, JOURNAL)))
+
+        journal = os.path.join(tempfile.mkdtemp(), JOURNAL)
+        try:
+            load_folder(FakeClient({}), self.folder, journal_path=journal)
+            self.assertTrue(os.path.exists(journal))
+            done = FakeClient({})
+            load_folder(done, self.folder, journal_path=journal, resume=True)
+            self.assertEqual(done.written, [])
+        finally:
+            shutil.rmtree(os.path.dirname(journal))
+
+    def test_load_resume_changed_file(self):
+        load_folder(FakeClient({}), self.folder, resume=True)
+        datafile = list_files(self.folder, "cpu")[0]
+        with open(datafile) as fd:
+            data = json.load(fd)
+        data["records"] = data["records"][:1]
+        with open(datafile, "w") as fd:
+            json.dump(data, fd)
+
+        client = FakeClient({})
+        load_folder(client, self.folder, resume=True)
+        self.assertEqual(client.written, [[{
+            "measurement": "cpu",
+            "time": data["records"][0]["time"],
+            "fields": {"value": data["records"][0]["value"]},
+        }]])
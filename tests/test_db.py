@@ -1,7 +1,23 @@
 # -*- coding: utf-8 -*-
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+import os
+import shutil
+import tempfile
+import threading
 import unittest
+from urllib.parse import parse_qs, urlparse
 
-from influxdump.db import Query
+from influxdump.db import (
+    Query,
+    SchemaCache,
+    get_client,
+    get_schema,
+    get_windows,
+    parse_duration,
+    parse_time,
+)
 
 
 class TestQuery(unittest.TestCase):
@@ -11,3 +27,200 @@ class TestQuery(unittest.TestCase):
                 q.get_query(),
                 "SELECT * FROM \"test_measurement\""
         )
+
+    def test_window_query(self):
+        q = Query("test_measurement", ctx={
+            "start": "2020-01-01T00:00:00Z",
+            "end": "2020-01-02T00:00:00Z",
+            "exclusive_end": True,
+        })
+        self.assertEqual(
+                q.get_query(),
+                "SELECT * FROM \"test_measurement\" WHERE "
+                "time >= '2020-01-01T00:00:00Z' AND "
+                "time < '2020-01-02T00:00:00Z'"
+        )
+
+    def test_shard(self):
+        q = Query("m", ctx={"start": "", "end": "2020-01-03T00:00:00Z"})
+        shards = q.shard([
+            ("", "2020-01-02T00:00:00Z"),
+            ("2020-01-02T00:00:00Z", "2020-01-03T00:00:00Z"),
+        ])
+        self.assertEqual(
+                [s.get_query() for s in shards],
+                [
+                    "SELECT * FROM \"m\" WHERE "
+                    "time < '2020-01-02T00:00:00Z'",
+                    "SELECT * FROM \"m\" WHERE "
+                    "time >= '2020-01-02T00:00:00Z' AND "
+                    "time <= '2020-01-03T00:00:00Z'",
+                ]
+        )
+        self.assertEqual(shards[1].ctx["shard"], 2)
+        self.assertEqual(shards[1].ctx["shards"], 2)
+
+    def test_shard_exclusive_start(self):
+        q = Query("m", ctx={"start": "2020-01-01T00:00:00Z", "end": "",
+            "exclusive_start": True})
+        shards = q.shard([
+            ("2020-01-01T00:00:00Z", "2020-01-02T00:00:00Z"),
+            ("2020-01-02T00:00:00Z", ""),
+        ])
+        self.assertEqual(
+                [s.get_query() for s in shards],
+                [
+                    "SELECT * FROM \"m\" WHERE "
+                    "time > '2020-01-01T00:00:00Z' AND "
+                    "time < '2020-01-02T00:00:00Z'",
+                    "SELECT * FROM \"m\" WHERE "
+                    "time >= '2020-01-02T00:00:00Z'",
+                ]
+        )
+
+
+class TestTime(unittest.TestCase):
+    def test_parse_time(self):
+        self.assertEqual(
+                parse_time("2019-01-01T00:00:00.5+01:00"),
+                datetime(2018, 12, 31, 23, 0, 0, 500000, tzinfo=timezone.utc)
+        )
+        self.assertEqual(
+                parse_time("2019-01-01T00:00:00.123456789Z").microsecond,
+                123456
+        )
+        with self.assertRaises(ValueError):
+            parse_time("yesterday")
+
+    def test_parse_duration(self):
+        self.assertEqual(parse_duration("90m"), timedelta(minutes=90))
+        with self.assertRaises(ValueError):
+            parse_duration("1y")
+
+    def test_get_windows(self):
+        first = parse_time("2020-01-01T00:00:00Z")
+        last = parse_time("2020-01-01T10:00:00Z")
+        self.assertEqual(
+                get_windows(first, last, timedelta(hours=4), "", "end"),
+                [
+                    ("", "2020-01-01T04:00:00Z"),
+                    ("2020-01-01T04:00:00Z", "2020-01-01T08:00:00Z"),
+                    ("2020-01-01T08:00:00Z", "end"),
+                ]
+        )
+
+
+class FakeResult(object):
+    def __init__(self, points):
+        self.points = points
+
+    def get_points(self):
+        return iter(self.points)
+
+
+class SchemaClient(object):
+    def __init__(self):
+        self.queries = []
+
+    def query(self, q):
+        self.queries.append(q)
+        if q.startswith("SHOW FIELD KEYS"):
+            return FakeResult([{"fieldKey": "value", "fieldType": "float"}])
+        return FakeResult([{"tagKey": "region"}, {"tagKey": "host"}])
+
+    def show_measurements(self):
+        self.queries.append("SHOW MEASUREMENTS")
+        return FakeResult([{"name": "cpu"}, {"name": "mem"}])
+
+    def get_points(self, res):
+        return res.get_points()
+
+
+class TestSchemaCache(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, "schema.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_memoize(self):
+        c = SchemaClient()
+        schema = SchemaCache()
+        for q in (Query("cpu"), Query("cpu", ctx={"start": "2020-01-01"})):
+            self.assertEqual(schema.get_fields(c, q), {"value": "float"})
+            self.assertEqual(schema.get_tags(c, q), ["host", "region"])
+            self.assertEqual(schema.get_measurements(c), ["cpu", "mem"])
+        self.assertEqual(len(c.queries), 3)
+
+    def test_snapshot(self):
+        c = SchemaClient()
+        schema = get_schema("localhost", 8086, "db", self.path)
+        schema.get_fields(c, Query("cpu"))
+        schema.save()
+
+        c = SchemaClient()
+        schema = get_schema("localhost", 8086, "db", self.path)
+        self.assertEqual(schema.get_fields(c, Query("cpu")),
+                {"value": "float"})
+        self.assertEqual(c.queries, [])
+
+        # snapshots of other databases are ignored
+        schema = get_schema("localhost", 8086, "other", self.path)
+        self.assertEqual(schema.fields, {})
+
+    def test_snapshot_expired(self):
+        schema = SchemaCache(self.path, ttl=60)
+        schema.get_fields(SchemaClient(), Query("cpu"))
+        schema.save()
+        with open(self.path) as fd:
+            snapshot = json.load(fd)
+        snapshot["time"] -= 120
+        with open(self.path, "w") as fd:
+            json.dump(snapshot, fd)
+
+        self.assertEqual(SchemaCache(self.path, ttl=60).load().fields, {})
+        self.assertEqual(SchemaCache(self.path, ttl=None).load().fields,
+                {"cpu": {"value": "float"}})
+
+
+class LegacyHandler(BaseHTTPRequestHandler):
+    """Serves the series of the influxdb 0.8 api"""
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        self.server.requests.append((url.path, parse_qs(url.query)["q"][0]))
+        body = json.dumps([{
+            "name": "cpu",
+            "columns": ["time", "value"],
+            "points": [[1577836800, 1.0]],
+        }]).encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class TestLegacyClient(unittest.TestCase):
+    def setUp(self):
+        self.server = HTTPServer(("127.0.0.1", 0), LegacyHandler)
+        self.server.requests = []
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_query(self):
+        client = get_client("127.0.0.1", self.server.server_address[1],
+                "root", "root", "db", legacy=True)
+        res = client.query("LIST SERIES")
+        self.assertEqual(list(client.get_points(res)),
+                [{"time": 1577836800, "value": 1.0}])
+        self.assertEqual(self.server.requests,
+                [("/db/db/series", "LIST SERIES")])
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from influxdump.lineprotocol import encode_records, rfc3339_to_ns
+
+
+class TestLineProtocol(unittest.TestCase):
+    def test_rfc3339_to_ns(self):
+        self.assertEqual(rfc3339_to_ns("1970-01-01T00:00:01Z"), 10 ** 9)
+        self.assertEqual(
+                rfc3339_to_ns("2020-01-01T00:00:00.123456789Z"),
+                1577836800123456789
+        )
+        self.assertEqual(
+                rfc3339_to_ns("2020-01-01T01:00:00.5+01:00"),
+                1577836800500000000
+        )
+        with self.assertRaises(ValueError):
+            rfc3339_to_ns("2020-01-01")
+
+    def test_encode_records(self):
+        records = [
+            {"time": "1970-01-01T00:00:01Z", "a b": 1, "c": "x \"y\"",
+                "d": True, "e": None},
+            {"time": "1970-01-01T00:00:02Z", "e": None},
+        ]
+        self.assertEqual(list(encode_records("m,1", records)), [
+            'm\\,1 a\\ b=1i,c="x \\"y\\"",d=true 1000000000',
+        ])
+
+    def test_encode_records_cast(self):
+        records = [{"time": "1970-01-01T00:00:01Z", "a": 1, "b": 2}]
+        self.assertEqual(
+                list(encode_records("m", records, {"a": "float", "*": "str"})),
+                ['m a=1.0,b="2" 1000000000']
+        )
+
+    def test_encode_records_tags(self):
+        records = [
+            {"time": 1, "value": 1.0, "region": "eu west", "host": "a"},
+            {"time": 2, "value": 2.0, "region": None, "host": "b"},
+        ]
+        self.assertEqual(
+                list(encode_records("m", records, {"*": "int"},
+                    tags=["region", "host"])),
+                ['m,host=a,region=eu\\ west value=1i 1',
+                    'm,host=b value=2i 2']
+        )
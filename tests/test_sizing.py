@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from influxdump.sizing import Sizer, record_size
+
+
+class TestSizer(unittest.TestCase):
+    def test_initial(self):
+        sizer = Sizer(500)
+        self.assertEqual(sizer.get_size(), 500)
+        self.assertEqual(sizer.get_size("cpu"), 500)
+
+    def test_latency(self):
+        sizer = Sizer(500, latency=1.0, memory=1 << 30)
+        # 1ms per record
+        sizer.observe("cpu", 1000, 1.0, 100)
+        self.assertEqual(sizer.get_size("cpu"), 1000)
+        self.assertEqual(sizer.get_size(), 1000)
+        # keys without observations get the initial size, their records may
+        # be much larger
+        self.assertEqual(sizer.get_size("mem"), 500)
+
+        sizer.observe("mem", 1000, 0.1, 100)
+        self.assertEqual(sizer.get_size("mem"), 10000)
+        self.assertEqual(sizer.get_size("cpu"), 1000)
+
+    def test_memory(self):
+        sizer = Sizer(500, latency=1.0, memory=1 << 20)
+        sizer.observe(None, 10, 0.0, 1 << 10)
+        self.assertEqual(sizer.get_size(), 1 << 10)
+
+    def test_bounds(self):
+        sizer = Sizer(500, minimum=100, maximum=2000)
+        sizer.observe(None, 10, 100.0, 1)
+        self.assertEqual(sizer.get_size(), 100)
+        sizer = Sizer(500, minimum=100, maximum=2000)
+        sizer.observe(None, 10, 0.0, 1)
+        self.assertEqual(sizer.get_size(), 2000)
+
+    def test_smoothing(self):
+        sizer = Sizer(500, latency=1.0, memory=1 << 30, maximum=1 << 30)
+        sizer.observe(None, 1000, 1.0, 1)
+        sizer.observe(None, 1000, 0.0, 1)
+        # a single fast request does not reset the average
+        self.assertLess(sizer.get_size(), 2000)
+        self.assertGreater(sizer.get_size(), 1000)
+
+    def test_resize(self):
+        sizer = Sizer(500, latency=1.0, memory=1 << 30)
+        self.assertIsNone(sizer.resize("cpu", 500))
+        sizer.observe("cpu", 500, 0.5, 100)
+        self.assertIsNone(sizer.resize("cpu", 600))
+        self.assertEqual(sizer.resize("cpu", 400), 1000)
+        self.assertEqual(sizer.resize("cpu", 2000), 1000)
+
+    def test_record_size(self):
+        point = {"measurement": "cpu", "fields": {"value": 1.0}}
+        self.assertGreater(record_size(point),
+                record_size({"measurement": "cpu"}) + record_size(1.0))
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+import io
+import json
+import unittest
+
+from influxdump.stream import read_documents, write_document
+
+
+class TestWriteDocument(unittest.TestCase):
+    def test_same_as_json_dump(self):
+        meta = {"measurement": "cpu", "context": {"start": ""}}
+        records = [{"time": "2020-01-01T00:00:00Z", "value": 1.5},
+                {"time": "2020-01-01T00:00:01Z", "value": None}]
+        fd = io.StringIO()
+        count = write_document(fd, meta, iter(records))
+        self.assertEqual(count, 2)
+        self.assertEqual(fd.getvalue(),
+                json.dumps({"meta": meta, "records": records}))
+
+    def test_empty(self):
+        fd = io.StringIO()
+        self.assertEqual(write_document(fd, {}, []), 0)
+        self.assertEqual(json.loads(fd.getvalue()), {"meta": {}, "records": []})
+
+
+class TestReadDocuments(unittest.TestCase):
+    def read(self, text, bufsize=7):
+        return [(meta, list(records)) for (meta, records)
+                in read_documents(io.StringIO(text), bufsize)]
+
+    def test_stream(self):
+        records = [{"time": "t{}".format(i), "value": 12345.5 * i}
+                for i in range(20)]
+        text = json.dumps({"meta": {"measurement": "cpu"}, "records": records})
+        self.assertEqual(self.read(text),
+                [({"measurement": "cpu"}, records)])
+
+    def test_multiple_documents(self):
+        text = "\n".join(json.dumps({"meta": {"n": i}, "records": [{"v": i}]})
+                for i in range(3)) + "\n"
+        self.assertEqual(self.read(text),
+                [({"n": i}, [{"v": i}]) for i in range(3)])
+
+    def test_records_before_meta(self):
+        text = '{"records": [{"v": 1}, {"v": 2}], "meta": {"n": 1}}'
+        self.assertEqual(self.read(text), [({"n": 1}, [{"v": 1}, {"v": 2}])])
+
+    def test_unconsumed_records(self):
+        text = '{"meta": {"n": 1}, "records": [{"v": 1}]}' \
+                '{"meta": {"n": 2}, "records": []}'
+        metas = [meta for (meta, _) in read_documents(io.StringIO(text), 5)]
+        self.assertEqual(metas, [{"n": 1}, {"n": 2}])
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            self.read('{"meta": {}, "records": [{"v": 1} {"v": 2}]}')